@@ -68,10 +68,6 @@
 // A global pointer to the libuv event loop which we'll set and use later on...
 static uv_loop_t *loop;
 
-// The "struct addrinfo" which will be set to the address/port of the SpiNNaker
-// system we provide.
-static struct addrinfo *addrinfo;
-
 // A reference to our connection to the machine.
 rs_conn_t *conn;
 
@@ -87,6 +83,9 @@ void cmd_ver_callback(rs_conn_t *conn,
                       uint32_t arg3,
                       uv_buf_t data,
                       void *cb_data);
+void cmd_ver_flush_callback(rs_conn_t *conn,
+                            int error,
+                            void *cb_data);
 void read_callback(rs_conn_t *conn,
                    int error,
                    uint16_t cmd_rc,
@@ -99,9 +98,9 @@ void write_callback(rs_conn_t *conn,
                     void *cb_data);
 void conn_freed_callback(void *cb_data);
 
-// Flag indicating we've received a response to the CMD_VER command from each
-// core. (We use this to determine when all the CMD_VER commands have finished.)
-bool got_cmd_ver_response[N_CPUS];
+// A single block of memory holding the response buffers of every CMD_VER
+// command (one scp_data_length sized buffer per CPU).
+char *cmd_ver_response_data;
 
 
 // A timestamp (in msec) we'll use this to time how long each operation takes in
@@ -136,6 +135,7 @@ main(int argc, char *argv[])
 	// resolve the IP address of the given host. Note: libuv provides an
 	// asynchronous version of getaddrinfo (uv_getaddrinfo) but we don't use it in
 	// this example for simplicity's sake.
+	struct addrinfo *addrinfo;
 	struct addrinfo hints;
 	memset(&hints, 0, sizeof(hints));
 	hints.ai_family = AF_INET;  // SpiNNaker only supports IPv4
@@ -146,9 +146,10 @@ main(int argc, char *argv[])
 	
 	// Now lets initialise the Rig SCP connection. You need one of these for every
 	// physical connection to the machine available. In this case we'll just make
-	// one. Also, note that all connection parameters are set at connection time
-	// and cannot be changed: you must disconnect and recreate the connection with
-	// new parameters if you wish to change them later.
+	// one. Also, note that n_outstanding is fixed at connection time and
+	// scp_data_length may only be reduced later (using rs_update_params): you
+	// must disconnect and recreate the connection with new parameters if you
+	// wish to change them further.
 	conn = rs_init(loop,
 	               addrinfo->ai_addr,
 	               scp_data_length,
@@ -157,46 +158,73 @@ main(int argc, char *argv[])
 	               n_outstanding);
 	assert(conn);
 	
+	// Rig SCP keeps its own copy of the address so we can free the addrinfo
+	// straight away.
+	freeaddrinfo(addrinfo);
+	
 	// Start timing...
 	last_time = uv_now(loop);
 	
 	// Now we'll send out an CMD_VER command to each of the N_CPUS CPUs in
-	// parallel.
+	// parallel. Since we want to send a whole batch of commands at once, we'll
+	// describe all of them up-front and queue them with a single call.
 	printf("Sending CMD_VER to %d CPUs...\n", N_CPUS);
+	rs_send_scp_req_t cmd_ver_reqs[N_CPUS];
+	
+	// We must provide buffers to store the response data from each SCP command.
+	// Rather than allocating one per command, we allocate a single block large
+	// enough for all of them and give each command its own slice.
+	cmd_ver_response_data = malloc(N_CPUS * scp_data_length);
+	assert(cmd_ver_response_data);
+	
 	unsigned int i;
 	for (i = 0; i < N_CPUS; i++) {
-		got_cmd_ver_response[i] = false;
-		
-		// We must allocate a buffer to store the response data from the SCP command
-		// which we specify as a uv_buf_t (as is the convention in libuv) which has
-		// two fields: base and len. The base is a pointer to the start of the
+		// Buffers are specified as a uv_buf_t (as is the convention in libuv) which
+		// has two fields: base and len. The base is a pointer to the start of the
 		// buffer and len is used to indicate the length of the useful data within
-		// it). We'll allocate rs_send_scp bytes which should be large enough to
+		// it). Each buffer is scp_data_length bytes which should be large enough to
 		// accept the CMD_VER response. To indicate that there is no data to be sent
 		// with our CMD_VER command we initially set data.len to 0.
 		uv_buf_t data;
-		data.base = malloc(scp_data_length);
-		assert(data.base);
+		data.base = cmd_ver_response_data + (i * scp_data_length);
 		data.len = 0;
 		
-		// The following function actually queues up the packet to be sent and
-		// registers a callback, cmd_ver_callback, for when the response comes back.
-		// The last callback to complete will trigger the next part of the example
-		// program: bulk read/write operations.
-		rs_send_scp(conn,
-		            DEST_CHIP,
-		            i, // CPU i
-		            0, // cmd_rc: CMD_VER
-		            3, // Must provide three arguments for CMD_VER (though their
-		               // value is unimportant)
-		            3, // All three arguments are expected in the response
-		            0, 0, 0, // Args1-3 just set arbitrarily.
-		            data, // No data to be sent but we'll get the response data here
-		            scp_data_length, // Maximum length of response
-		            cmd_ver_callback, // Callback on completion.
-		            &(got_cmd_ver_response[i]));
+		// Each rs_send_scp_req_t describes a single packet to send along with a
+		// callback, cmd_ver_callback, for when the response comes back. The fields
+		// have exactly the same meanings as the arguments of rs_send_scp which
+		// could be used instead to send a single packet.
+		cmd_ver_reqs[i].dest_addr = DEST_CHIP;
+		cmd_ver_reqs[i].dest_cpu = i; // CPU i
+		cmd_ver_reqs[i].cmd_rc = 0; // cmd_rc: CMD_VER
+		cmd_ver_reqs[i].n_args_send = 3; // Must provide three arguments for
+		                                 // CMD_VER (though their value is
+		                                 // unimportant)
+		cmd_ver_reqs[i].n_args_recv = 3; // All three arguments are expected in
+		                                 // the response
+		cmd_ver_reqs[i].arg1 = 0; // Args1-3 just set arbitrarily.
+		cmd_ver_reqs[i].arg2 = 0;
+		cmd_ver_reqs[i].arg3 = 0;
+		cmd_ver_reqs[i].data = data; // No data to be sent but we'll get the
+		                             // response data here
+		cmd_ver_reqs[i].data_max_len = scp_data_length; // Maximum length of
+		                                                // response
+		cmd_ver_reqs[i].cb = cmd_ver_callback; // Callback on completion.
+		cmd_ver_reqs[i].cb_data = NULL; // No user data required
 	}
 	
+	// The following function actually queues up the packets to be sent. Queueing
+	// them all at once allows Rig SCP to fire off as many as it can in a single
+	// burst.
+	success = rs_send_scp_batch(conn, cmd_ver_reqs, N_CPUS);
+	assert(success == 0);
+	
+	// Rather than keeping track of which responses have arrived, we ask Rig SCP
+	// to call cmd_ver_flush_callback once every command queued so far has
+	// completed. This will trigger the next part of the example program: bulk
+	// read/write operations.
+	success = rs_flush(conn, cmd_ver_flush_callback, NULL);
+	assert(success == 0);
+	
 	// The rest of this program's activity will be purely event based so we just
 	// start the libuv event loop. The event loop will be terminated by a call to
 	// uv_stop in our final callback handler, returning control back here.
@@ -275,53 +303,58 @@ cmd_ver_callback(rs_conn_t *conn,
 	unsigned int cpu_num = (arg1 >> 0) & 0xFF;
 	const char *vers_string = data.base;
 	double vers_num = (double)((arg2 >> 16) & 0xFFFF) / 100.0;
-	printf("Got response from (%u, %u, %2u) with software '%s' v%1.2f.\n",
-	       x, y, cpu_num, vers_string, vers_num);
+	// Note that the string is printed with an explicit maximum length: printf
+	// stops at the first null but never reads past the end of the response
+	// data, even if the machine didn't null-terminate the string.
+	printf("Got response from (%u, %u, %2u) with software '%.*s' v%1.2f.\n",
+	       x, y, cpu_num, (int)data.len, vers_string, vers_num);
+}
+
+
+/**
+ * Callback function called once all the CMD_VER commands have completed.
+ */
+void
+cmd_ver_flush_callback(rs_conn_t *conn,
+                       int error,
+                       void *cb_data)
+{
+	if (error) {
+		printf("ERROR: %s\n", rs_strerror(error));
+		abort();
+	}
 	
-	// Free the buffer we used for the response data
-	free(data.base);
+	printf("All responses received after %0.0f ms.\n\n",
+	       (double)(uv_now(loop) - last_time));
 	
-	// Get the pointer to the callback response flag we provided as user data and
-	// indicate we've got a response.
-	bool *my_got_cmd_ver = (bool *)cb_data;
-	*my_got_cmd_ver = true;
+	// Free the buffers we used for the response data
+	free(cmd_ver_response_data);
 	
-	// If all responses have been received, start the write operation
-	bool got_all_replies = true;
+	// Generate some random data to write and set up a uv_buf_t as before, this
+	// time we set the len field to indicate how much data in the buffer is to be
+	// written.
 	int i;
-	for (i = 0; i < N_CPUS; i++)
-		if (!got_cmd_ver_response[i])
-			got_all_replies = false;
+	for (i = 0; i < DATA_LEN; i++)
+		write_data[i] = rand();
+	uv_buf_t data;
+	data.base = (void *)write_data;
+	data.len = DATA_LEN;
 	
-	if (got_all_replies) {
-		printf("All responses received after %0.0f ms.\n\n",
-		       (double)(uv_now(loop) - last_time));
-		
-		// Generate some random data to write and set up a uv_buf_t as before, this
-		// time we set the len field to indicate how much data in the buffer is to
-		// be written.
-		for (i = 0; i < DATA_LEN; i++)
-			write_data[i] = rand();
-		uv_buf_t data;
-		data.base = (void *)write_data;
-		data.len = DATA_LEN;
-		
-		printf("Writing %u bytes of random data to 0x%08X...\n",
-		       DATA_LEN, TEST_ADDRESS);
-		
-		// Start timing again...
-		last_time = uv_now(loop);
-		
-		// Now lets actually queue up the write, setting up a callback for when the
-		// write completes.
-		rs_write(conn,
-		         DEST_CHIP,
-		         0, // Write to CPU 0's memory
-		         TEST_ADDRESS,
-		         data,
-		         write_callback, // Callback when the write completes.
-		         NULL);
-	}
+	printf("Writing %u bytes of random data to 0x%08X...\n",
+	       DATA_LEN, TEST_ADDRESS);
+	
+	// Start timing again...
+	last_time = uv_now(loop);
+	
+	// Now lets actually queue up the write, setting up a callback for when the
+	// write completes.
+	rs_write(conn,
+	         DEST_CHIP,
+	         0, // Write to CPU 0's memory
+	         TEST_ADDRESS,
+	         data,
+	         write_callback, // Callback when the write completes.
+	         NULL);
 }
 
 
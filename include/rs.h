@@ -76,6 +76,20 @@ typedef void (*rs_rw_cb)(rs_conn_t *conn,
                          void *cb_data);
 
 
+/**
+ * Callback function type for rs_flush completion.
+ *
+ * @param conn The SCP connection which was flushed.
+ * @param error 0 if every request queued before the flush has completed
+ *              (successfully or otherwise). RS_EFREE if the connection was
+ *              freed before this happened.
+ * @param cb_data The pointer supplied when registering the callback.
+ */
+typedef void (*rs_flush_cb)(rs_conn_t *conn,
+                            int error,
+                            void *cb_data);
+
+
 /**
  * Callback function type for rs_free completion.
  *
@@ -90,12 +104,20 @@ typedef void (*rs_free_cb)(void *cb_data);
  * Returns NULL on failure.
  *
  * Note: to simplify implementation and work around shortcomings in the libuv
- * API, this library does not support the changing of the parameters supplied as
- * arguments. If these parameters need to be changed, the connection must be
- * closed (using rs_free) and a new connection made.
+ * API, this library only supports changing some of the parameters supplied as
+ * arguments (see rs_update_params). If other parameters need to be changed,
+ * the connection must be closed (using rs_free) and a new connection made.
+ *
+ * Memory: each connection allocates a 64 KiB receive buffer for every datagram
+ * which may be received by a single system call. Where libuv receives several
+ * datagrams at once using recvmmsg (libuv v1.37 or later, on platforms such as
+ * Linux which support it), this is MIN(n_outstanding, 16) datagrams (i.e. up
+ * to 1 MiB), otherwise just one. A packet buffer of around scp_data_length
+ * bytes is also allocated for each of the n_outstanding slots.
  *
  * @param loop The libuv event loop in which the connection will run.
- * @param addr The socket address of the remote machine.
+ * @param addr The socket address of the remote machine. This is copied and so
+ *             need not remain valid after this call returns.
  * @param scp_data_length The maximum length (in bytes) of the SCP data field.
  *                        This value should be chosen according to the target
  *                        devices' sver response.
@@ -113,6 +135,61 @@ rs_conn_t *rs_init(uv_loop_t *loop,
                    unsigned int n_tries,
                    unsigned int n_outstanding);
 
+/**
+ * Change the parameters of an existing connection.
+ *
+ * The new parameters apply to packets sent (or retransmitted) after this call.
+ * Packets already in flight keep the length they were sent with. The
+ * n_outstanding parameter cannot be changed.
+ *
+ * @param conn The connection to update.
+ * @param scp_data_length The maximum length (in bytes) of the SCP data field.
+ *                        Must be at least 1 and not greater than the value
+ *                        supplied to rs_init.
+ * @param timeout Number of milliseconds to wait for a response from the
+ *                machine before retransmitting.
+ * @param n_tries Number of transmission attempts to make (including initial
+ *                attempt) before giving up on a request. Must be at least 1.
+ * @returns 0 on success, non-zero if the parameters are invalid (in which case
+ *          the connection is unchanged).
+ */
+int rs_update_params(rs_conn_t *conn,
+                     size_t scp_data_length,
+                     uint64_t timeout,
+                     unsigned int n_tries);
+
+/**
+ * Limit the number of requests which may be queued on a connection.
+ *
+ * By default the request queue grows without bound. With a limit set, the
+ * rs_send_scp, rs_send_scp_batch, rs_read, rs_write and rs_flush functions
+ * return non-zero (and queue nothing) when the queue is full, allowing callers
+ * to apply back-pressure instead. Note that a read or write remains in the
+ * queue (and counts towards the limit) until its last packet has been sent.
+ *
+ * @param conn The connection to limit.
+ * @param max_length The maximum number of queued requests or 0 for no limit.
+ */
+void rs_set_max_queue_length(rs_conn_t *conn, size_t max_length);
+
+/**
+ * Set the kernel send and receive buffer sizes of a connection's socket.
+ *
+ * When many packets are outstanding, responses may arrive in bursts faster
+ * than they are read. A larger receive buffer prevents these being dropped by
+ * the kernel and the resulting (slow) timeouts and retransmissions. Note that
+ * on Linux the kernel doubles the value given and limits it according to the
+ * net.core.wmem_max and net.core.rmem_max sysctls.
+ *
+ * @param conn The connection whose socket should be configured.
+ * @param send_size The send buffer size (in bytes) or 0 to leave it unchanged.
+ * @param recv_size The receive buffer size (in bytes) or 0 to leave it
+ *                  unchanged.
+ * @returns 0 on success or a (negative) libuv error code otherwise (UV_EINVAL
+ *          if either size is negative, in which case neither is changed).
+ */
+int rs_set_socket_buffer_sizes(rs_conn_t *conn, int send_size, int recv_size);
+
 /**
  * Queue up an SCP packet to be sent via an SCP connection.
  *
@@ -158,6 +235,51 @@ int rs_send_scp(rs_conn_t *conn,
                 rs_send_scp_cb cb,
                 void *cb_data);
 
+/**
+ * Describes a single SCP packet to be queued by rs_send_scp_batch.
+ *
+ * Each field has the same meaning as the identically named argument of
+ * rs_send_scp.
+ */
+typedef struct {
+	uint16_t dest_addr;
+	uint8_t dest_cpu;
+	uint16_t cmd_rc;
+	unsigned int n_args_send;
+	unsigned int n_args_recv;
+	uint32_t arg1;
+	uint32_t arg2;
+	uint32_t arg3;
+	uv_buf_t data;
+	size_t data_max_len;
+	rs_send_scp_cb cb;
+	void *cb_data;
+} rs_send_scp_req_t;
+
+/**
+ * Queue up a batch of SCP packets to be sent via an SCP connection.
+ *
+ * This is equivalent to calling rs_send_scp once for each packet in the batch
+ * except that the request queue is only processed once all packets have been
+ * queued. As a result, as many packets as there are free outstanding slots are
+ * handed to the network in a single burst which libuv may then coalesce into
+ * fewer system calls.
+ *
+ * @param conn The connection to send the packets via.
+ * @param reqs An array of n_reqs packet descriptions. The array itself need
+ *             not remain valid after this function returns but the data
+ *             buffers it references must remain valid until their associated
+ *             callbacks are called.
+ * @param n_reqs The number of packets in the batch.
+ * @returns 0 if all packets were successfully queued, non-zero otherwise. On
+ *          failure no packets are queued (e.g. if the whole batch would not
+ *          fit in the request queue at once given the limit set by
+ *          rs_set_max_queue_length).
+ */
+int rs_send_scp_batch(rs_conn_t *conn,
+                      const rs_send_scp_req_t *reqs,
+                      size_t n_reqs);
+
 /**
  * Write a large block of data to a machine using SCP CMD_WRITE packets.
  *
@@ -165,8 +287,12 @@ int rs_send_scp(rs_conn_t *conn,
  * @param dest_addr The address of the chip to send the packet to.
  * @param dest_cpu The CPU number to send the packet to.
  * @param addr The address to write the data to.
- * @param data The data to write to the machine. Must remain valid until the
- *             callback function is called.
+ * @param data The data to write to the machine. Must remain valid and
+ *             unmodified until the callback function is called: packets are
+ *             sent (and retransmitted) directly from this buffer rather than
+ *             from a copy. The buffer is never written to and is no longer
+ *             accessed once the callback is called (even if the write failed)
+ *             so it may then be reused or freed.
  * @param cb A callback function which will be called when the write completes.
  * @param cb_data User-supplied data that will be passed to the callback
  *                function.
@@ -203,12 +329,37 @@ int rs_read(rs_conn_t *conn,
             rs_rw_cb cb,
             void *cb_data);
 
+/**
+ * Wait for all previously queued requests to complete.
+ *
+ * Queues a barrier behind all requests made so far. Once every one of them has
+ * completed and had its callback called, the supplied callback is called.
+ * Requests made after this call are not sent until the flush completes. This
+ * is cheaper than tracking the completion of each request individually when
+ * only the completion of a whole group of requests is of interest.
+ *
+ * @param conn The connection to flush.
+ * @param cb A callback function which will be called once all earlier requests
+ *           have completed. If nothing is queued or outstanding, this may be
+ *           called before rs_flush returns.
+ * @param cb_data User-supplied data that will be passed to the callback
+ *                function.
+ * @returns 0 if successfully queued, non-zero otherwise.
+ */
+int rs_flush(rs_conn_t *conn, rs_flush_cb cb, void *cb_data);
+
+
 /**
  * Free any resources used by an SCP connection.
  *
  * This command cancels any incomplete requests immediately with an error
- * RS_EFREE. Note that this command does not complete immediately and instead
- * relies on the libuv event loop running for a short time.
+ * RS_EFREE: the callbacks of all incomplete requests (including any rs_write
+ * callbacks which were waiting for packets to finish being sent) are called
+ * before rs_free returns. Since the connection's socket is closed, nothing more
+ * is sent from the buffers supplied to rs_write and so these may be reused or
+ * freed once their callbacks have been called. Note that this command does not
+ * complete immediately and instead relies on the libuv event loop running for a
+ * short time.
  *
  * @param conn The connection to free. This should be considered invalid
  *             immediately after calling this function.
@@ -241,13 +392,47 @@ void rs_free(rs_conn_t *conn, rs_free_cb cb, void *cb_data);
 
 /**
  * Returns the error message for the given error code.
+ *
+ * Note: for error codes unknown to libuv, libuv allocates a new string on
+ * every call which is never freed. Use rs_strerror_r to avoid this.
  */
 const char *rs_strerror(int err);
 
 
 /**
  * Returns the error name for the given error code.
+ *
+ * Note: for error codes unknown to libuv, libuv allocates a new string on
+ * every call which is never freed. Use rs_err_name_r to avoid this.
  */
 const char *rs_err_name(int err);
 
+
+/**
+ * Write the error message for the given error code into a buffer.
+ *
+ * Never allocates memory.
+ *
+ * @param err The error code.
+ * @param buf The buffer to write the (null terminated) message into. The
+ *            message is truncated if the buffer is too short.
+ * @param buflen The length of the buffer in bytes.
+ * @returns buf
+ */
+char *rs_strerror_r(int err, char *buf, size_t buflen);
+
+
+/**
+ * Write the error name for the given error code into a buffer.
+ *
+ * Never allocates memory.
+ *
+ * @param err The error code.
+ * @param buf The buffer to write the (null terminated) name into. The name is
+ *            truncated if the buffer is too short.
+ * @param buflen The length of the buffer in bytes.
+ * @returns buf
+ */
+char *rs_err_name_r(int err, char *buf, size_t buflen);
+
 #endif
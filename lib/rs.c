@@ -5,6 +5,7 @@
 
 #include <sys/socket.h>
 
+#include <stdio.h>
 #include <stdlib.h>
 #include <stdint.h>
 #include <stdbool.h>
@@ -30,12 +31,28 @@ rs_init(uv_loop_t *loop,
 	
 	// Store arguments
 	conn->loop = loop;
-	conn->addr = addr;
 	conn->scp_data_length = scp_data_length;
+	conn->max_scp_data_length = scp_data_length;
 	conn->timeout = timeout;
 	conn->n_tries = n_tries;
 	conn->n_outstanding = n_outstanding;
 	
+	// Take a copy of the address so that the caller need not keep it alive
+	memset(&(conn->addr), 0, sizeof(conn->addr));
+	switch (addr->sa_family) {
+		case AF_INET:
+			memcpy(&(conn->addr), addr, sizeof(struct sockaddr_in));
+			break;
+		
+		case AF_INET6:
+			memcpy(&(conn->addr), addr, sizeof(struct sockaddr_in6));
+			break;
+		
+		default:
+			memcpy(&(conn->addr), addr, sizeof(struct sockaddr));
+			break;
+	}
+	
 	// Clear the 'free' flag since we don't wish to free the strucutre
 	// immediately!
 	conn->free = false;
@@ -44,15 +61,32 @@ rs_init(uv_loop_t *loop,
 	// Initialise counters
 	conn->next_seq_num = 0;
 	conn->next_rw_id = 0;
+	conn->processing_request_queue = false;
+	conn->request_queue_dirty = false;
 	
 	// Initialise the socket
-	if (uv_udp_init(conn->loop, &(conn->udp_handle))) {
+	if (uv_udp_init_ex(conn->loop, &(conn->udp_handle), RS__UDP_INIT_FLAGS)) {
 		// Socket init failed!
 		free(conn);
 		return NULL;
 	}
 	conn->udp_handle_closed = false;
 	
+	// Allocate the buffer into which incoming datagrams will be received. At most
+	// n_outstanding responses are expected at once so there is no point in
+	// receiving more than this many datagrams at a time (and only one is ever
+	// received at a time if the socket isn't using recvmmsg).
+	unsigned int n_recv_dgrams = 1;
+	if (RS__USING_RECVMMSG(&(conn->udp_handle)))
+		n_recv_dgrams = MAX(1, MIN(conn->n_outstanding, RS__RECV_MAX_DGRAMS));
+	conn->recv_buf.len = RS__RECV_DGRAM_SIZE * n_recv_dgrams;
+	conn->recv_buf.base = malloc(conn->recv_buf.len);
+	if (!conn->recv_buf.base) {
+		// XXX: Doesn't close UDP handle before freeing!
+		free(conn);
+		return NULL;
+	}
+	
 	// Pass a pointer to the SCP connection whenever UDP data arrives
 	conn->udp_handle.data = (void *)conn;
 	
@@ -62,6 +96,7 @@ rs_init(uv_loop_t *loop,
 	                      rs__udp_recv_cb)) {
 		// Listening failed
 		// XXX: Doesn't close UDP handle before freeing!
+		free(conn->recv_buf.base);
 		free(conn);
 		return NULL;
 	}
@@ -72,6 +107,7 @@ rs_init(uv_loop_t *loop,
 	if (!conn->request_queue) {
 		// Queue allocation failed!
 		// XXX: Doesn't close UDP handle before freeing!
+		free(conn->recv_buf.base);
 		free(conn);
 		return NULL;
 	}
@@ -81,9 +117,27 @@ rs_init(uv_loop_t *loop,
 	if (!conn->outstanding) {
 		rs__q_free(conn->request_queue);
 		// XXX: Doesn't close UDP handle before freeing!
+		free(conn->recv_buf.base);
+		free(conn);
+		return NULL;
+	}
+	
+	// Allocate a single block of memory which holds the packet buffer of every
+	// outstanding slot. Each slot's buffer has sufficient space to buffer SCP
+	// packet data (and two empty padding bytes required when transmitting SCP
+	// over UDP).
+	size_t packet_buf_len =
+		RS__SIZEOF_SCP_PACKET(3, conn->max_scp_data_length) + 2;
+	conn->packet_bufs = malloc(conn->n_outstanding * packet_buf_len);
+	if (!conn->packet_bufs) {
+		free(conn->outstanding);
+		rs__q_free(conn->request_queue);
+		// XXX: Doesn't close UDP handle before freeing!
+		free(conn->recv_buf.base);
 		free(conn);
 		return NULL;
 	}
+	
 	int i;
 	for (i = 0; i < conn->n_outstanding; i++) {
 		conn->outstanding[i].conn = conn;
@@ -92,27 +146,21 @@ rs_init(uv_loop_t *loop,
 		conn->outstanding[i].send_req_active = false;
 		conn->outstanding[i].cancelled = false;
 		
-		// Allocate sufficient space to buffer SCP packet data (and two empty
-		// padding bytes required when transmitting SCP over UDP).
+		// Give the slot its share of the packet buffer block
 		conn->outstanding[i].packet.base =
-			malloc(RS__SIZEOF_SCP_PACKET(3, conn->scp_data_length) + 2);
-		if (!conn->outstanding[i].packet.base) {
-			while (--i >= 0)
-				free(conn->outstanding[i].packet.base);
-			rs__q_free(conn->request_queue);
-			free(conn);
-			return NULL;
-		}
+			conn->packet_bufs + (i * packet_buf_len);
+		
 		// Zero the two included padding bytes
 		memset(conn->outstanding[i].packet.base, 0, 2);
 		
 		// Initialise the timer
 		if (uv_timer_init(conn->loop, &(conn->outstanding[i].timer_handle))) {
 			// Timer init failed, cleanup
-			while (i >= 0)
-				// XXX: Doesn't close timer handles before freeing!
-				free(conn->outstanding[i--].packet.base);
+			// XXX: Doesn't close timer handles before freeing!
+			free(conn->packet_bufs);
+			free(conn->outstanding);
 			rs__q_free(conn->request_queue);
+			free(conn->recv_buf.base);
 			free(conn);
 			return NULL;
 		}
@@ -128,6 +176,87 @@ rs_init(uv_loop_t *loop,
 }
 
 
+int
+rs_update_params(rs_conn_t *conn,
+                 size_t scp_data_length,
+                 uint64_t timeout,
+                 unsigned int n_tries)
+{
+	// The packet buffers can't grow whilst packets may be outstanding and
+	// reads/writes can't be split into empty packets
+	if (scp_data_length < 1 || scp_data_length > conn->max_scp_data_length ||
+	    n_tries < 1)
+		return -1;
+	
+	conn->scp_data_length = scp_data_length;
+	conn->timeout = timeout;
+	conn->n_tries = n_tries;
+	
+	return 0;
+}
+
+
+void
+rs_set_max_queue_length(rs_conn_t *conn, size_t max_length)
+{
+	rs__q_set_max_length(conn->request_queue, max_length);
+}
+
+
+int
+rs_set_socket_buffer_sizes(rs_conn_t *conn, int send_size, int recv_size)
+{
+	int err;
+	
+	if (send_size < 0 || recv_size < 0)
+		return UV_EINVAL;
+	
+	// Note: libuv treats a size of zero as a query of the current size, leaving
+	// it unchanged.
+	if ((err = uv_send_buffer_size((uv_handle_t *)&(conn->udp_handle),
+	                               &send_size)))
+		return err;
+	
+	if ((err = uv_recv_buffer_size((uv_handle_t *)&(conn->udp_handle),
+	                               &recv_size)))
+		return err;
+	
+	return 0;
+}
+
+
+/**
+ * Insert a single SCP packet request into the request queue without processing
+ * the queue.
+ *
+ * @returns 0 if successfuly queued, non-zero otherwise.
+ */
+static int
+rs__queue_scp_packet(rs_conn_t *conn, const rs_send_scp_req_t *scp_req)
+{
+	rs__req_t *req = (rs__req_t *)rs__q_insert(conn->request_queue);
+	if (!req)
+		return -1;
+	
+	// Queue up the supplied request
+	req->type = RS__REQ_SCP_PACKET;
+	req->dest_addr = scp_req->dest_addr;
+	req->dest_cpu = scp_req->dest_cpu;
+	req->data.scp_packet.cmd_rc = scp_req->cmd_rc;
+	req->data.scp_packet.n_args_send = scp_req->n_args_send;
+	req->data.scp_packet.n_args_recv = scp_req->n_args_recv;
+	req->data.scp_packet.arg1 = scp_req->arg1;
+	req->data.scp_packet.arg2 = scp_req->arg2;
+	req->data.scp_packet.arg3 = scp_req->arg3;
+	req->data.scp_packet.data = scp_req->data;
+	req->data.scp_packet.data_max_len = scp_req->data_max_len;
+	req->data.scp_packet.cb = scp_req->cb;
+	req->cb_data = scp_req->cb_data;
+	
+	return 0;
+}
+
+
 int
 rs_send_scp(rs_conn_t *conn,
             uint16_t dest_addr,
@@ -143,24 +272,44 @@ rs_send_scp(rs_conn_t *conn,
             rs_send_scp_cb cb,
             void *cb_data)
 {
-	rs__req_t *req = (rs__req_t *)rs__q_insert(conn->request_queue);
-	if (!req)
+	rs_send_scp_req_t scp_req;
+	scp_req.dest_addr = dest_addr;
+	scp_req.dest_cpu = dest_cpu;
+	scp_req.cmd_rc = cmd_rc;
+	scp_req.n_args_send = n_args_send;
+	scp_req.n_args_recv = n_args_recv;
+	scp_req.arg1 = arg1;
+	scp_req.arg2 = arg2;
+	scp_req.arg3 = arg3;
+	scp_req.data = data;
+	scp_req.data_max_len = data_max_len;
+	scp_req.cb = cb;
+	scp_req.cb_data = cb_data;
+	
+	if (rs__queue_scp_packet(conn, &scp_req))
 		return -1;
 	
-	// Queue up the supplied request
-	req->type = RS__REQ_SCP_PACKET;
-	req->dest_addr = dest_addr;
-	req->dest_cpu = dest_cpu;
-	req->data.scp_packet.cmd_rc = cmd_rc;
-	req->data.scp_packet.n_args_send = n_args_send;
-	req->data.scp_packet.n_args_recv = n_args_recv;
-	req->data.scp_packet.arg1 = arg1;
-	req->data.scp_packet.arg2 = arg2;
-	req->data.scp_packet.arg3 = arg3;
-	req->data.scp_packet.data = data;
-	req->data.scp_packet.data_max_len = data_max_len;
-	req->data.scp_packet.cb = cb;
-	req->cb_data = cb_data;
+	rs__process_request_queue(conn);
+	
+	return 0;
+}
+
+
+int
+rs_send_scp_batch(rs_conn_t *conn,
+                  const rs_send_scp_req_t *reqs,
+                  size_t n_reqs)
+{
+	// Make room for the whole batch up-front so that either every packet is
+	// queued or none are.
+	if (rs__q_reserve(conn->request_queue, n_reqs))
+		return -1;
+	
+	// Queue up every packet before processing the queue so that the packets
+	// are dispatched back-to-back. These insertions cannot fail.
+	size_t i;
+	for (i = 0; i < n_reqs; i++)
+		rs__queue_scp_packet(conn, reqs + i);
 	
 	rs__process_request_queue(conn);
 	
@@ -228,6 +377,24 @@ rs_read(rs_conn_t *conn,
 }
 
 
+int
+rs_flush(rs_conn_t *conn, rs_flush_cb cb, void *cb_data)
+{
+	rs__req_t *req = (rs__req_t *)rs__q_insert(conn->request_queue);
+	if (!req)
+		return -1;
+	
+	// Queue up the barrier
+	req->type = RS__REQ_FLUSH;
+	req->data.flush.cb = cb;
+	req->cb_data = cb_data;
+	
+	rs__process_request_queue(conn);
+	
+	return 0;
+}
+
+
 void
 rs__udp_handle_closed_cb(uv_handle_t *handle)
 {
@@ -269,6 +436,12 @@ rs_free(rs_conn_t *conn, rs_free_cb cb, void *cb_data)
 	if (!uv_is_closing((uv_handle_t *)&(conn->udp_handle)))
 		uv_close((uv_handle_t *)&(conn->udp_handle), rs__udp_handle_closed_cb);
 	
+	// Call any read/write callbacks which were deferred until their send
+	// requests completed: now the socket is closed, nothing more will be sent
+	// from the user's buffers.
+	for (i = 0; i < conn->n_outstanding; i++)
+		rs__flush_deferred_rw_cb(conn, conn->outstanding + i);
+	
 	for (i = 0; i < conn->n_outstanding; i++) {
 		// Cancel all outstanding requests
 		rs__cancel_outstanding(conn, &(conn->outstanding[i]), RS_EFREE, -1);
@@ -299,10 +472,10 @@ rs_free(rs_conn_t *conn, rs_free_cb cb, void *cb_data)
 		return;
 	
 	// Everything has shut down, free all resources now!
-	for (i = 0; i < conn->n_outstanding; i++)
-		free(conn->outstanding[i].packet.base);
+	free(conn->packet_bufs);
 	free(conn->outstanding);
 	rs__q_free(conn->request_queue);
+	free(conn->recv_buf.base);
 	
 	// Just before freeing the main struct, take a copy of the callback function
 	cb = conn->free_cb;
@@ -347,3 +520,35 @@ rs_err_name(int err)
 		default:          return uv_err_name(err);
 	}
 }
+
+
+char *
+rs_strerror_r(int err, char *buf, size_t buflen)
+{
+	switch (err) {
+		case RS_EBAD_RC:
+		case RS_ETIMEOUT:
+		case RS_EFREE:
+			snprintf(buf, buflen, "%s", rs_strerror(err));
+			return buf;
+		
+		default:
+			return uv_strerror_r(err, buf, buflen);
+	}
+}
+
+
+char *
+rs_err_name_r(int err, char *buf, size_t buflen)
+{
+	switch (err) {
+		case RS_EBAD_RC:
+		case RS_ETIMEOUT:
+		case RS_EFREE:
+			snprintf(buf, buflen, "%s", rs_err_name(err));
+			return buf;
+		
+		default:
+			return uv_err_name_r(err, buf, buflen);
+	}
+}
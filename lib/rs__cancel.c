@@ -24,6 +24,13 @@ rs__cancel_outstanding(rs_conn_t *conn, rs__outstanding_t *os,
 	if (!os->active || os->cancelled)
 		return;
 	
+	// Hold off processing the request queue until the cancellation is complete:
+	// cancelling a read/write cancels its other outstanding slots (each of which
+	// would otherwise trigger a full pass of the queue) and until the request is
+	// removed from the queue below, a pass could send more of its packets.
+	bool was_processing_request_queue = conn->processing_request_queue;
+	conn->processing_request_queue = true;
+	
 	// Indicate that this request has been cancelled
 	if (!os->send_req_active) {
 		os->active = false;
@@ -75,9 +82,11 @@ rs__cancel_outstanding(rs_conn_t *conn, rs__outstanding_t *os,
 			
 			case RS__REQ_READ:
 			case RS__REQ_WRITE:
-				os->data.rw.cb(conn, error,
-				               cmd_rc, os->data.rw.orig_data,
-				               os->cb_data);
+				rs__complete_rw(conn, os, error, cmd_rc);
+				break;
+			
+			case RS__REQ_FLUSH:
+				// Never placed in an outstanding slot
 				break;
 		}
 	}
@@ -106,7 +115,9 @@ rs__cancel_outstanding(rs_conn_t *conn, rs__outstanding_t *os,
 	}
 	
 	// We have possibly cleared an outstanding packet, attempt to queue a new
-	// packet in its place
+	// packet in its place (this is coalesced into the running pass if this
+	// cancellation occurred while processing the queue)
+	conn->processing_request_queue = was_processing_request_queue;
 	rs__process_request_queue(conn);
 }
 
@@ -129,5 +140,9 @@ rs__cancel_queued(rs_conn_t *conn, rs__req_t *req, int error)
 			                0, req->data.rw.orig_data,
 			                req->cb_data);
 			break;
+		
+		case RS__REQ_FLUSH:
+			req->data.flush.cb(conn, error, req->cb_data);
+			break;
 	}
 }
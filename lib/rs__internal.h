@@ -15,7 +15,41 @@
 #endif
 
 #ifndef MAX
-#define MAX(a, b) (((a) < (b)) ? (a) : (b))
+#define MAX(a, b) (((a) > (b)) ? (a) : (b))
+#endif
+
+
+/**
+ * Space reserved for each datagram in the receive buffer. This matches the size
+ * libuv suggests (and requires when receiving several datagrams at once) and is
+ * large enough for any UDP datagram.
+ */
+#define RS__RECV_DGRAM_SIZE (64 * 1024)
+
+
+/**
+ * Flags used to initialise the UDP handle and the maximum number of datagrams
+ * which may be received by a single system call. Where libuv supports it (v1.37
+ * and later), recvmmsg is used to drain several responses at once.
+ */
+#if UV_VERSION_HEX >= 0x012500
+#define RS__UDP_INIT_FLAGS (AF_UNSPEC | UV_UDP_RECVMMSG)
+#define RS__RECV_MAX_DGRAMS 16
+#else
+#define RS__UDP_INIT_FLAGS AF_UNSPEC
+#define RS__RECV_MAX_DGRAMS 1
+#endif
+
+/**
+ * Evaluates to true if an initialised UDP handle actually receives several
+ * datagrams at once. libuv silently ignores UV_UDP_RECVMMSG on platforms
+ * without recvmmsg, which can only be queried in v1.39 and later (earlier
+ * versions are assumed to use it when requested).
+ */
+#if UV_VERSION_HEX >= 0x012700
+#define RS__USING_RECVMMSG(handle) uv_udp_using_recvmmsg(handle)
+#else
+#define RS__USING_RECVMMSG(handle) (RS__RECV_MAX_DGRAMS > 1)
 #endif
 
 
@@ -31,6 +65,10 @@ typedef enum {
 	
 	// Send a bulk write request
 	RS__REQ_WRITE,
+	
+	// Wait for all earlier requests to complete (never placed in an outstanding
+	// slot)
+	RS__REQ_FLUSH,
 } rs__req_type_t;
 
 
@@ -107,6 +145,12 @@ typedef struct {
 			// Callback function on completion
 			rs_rw_cb cb;
 		} rw;
+		
+		// Data for flush requests
+		struct {
+			// Callback function on completion
+			rs_flush_cb cb;
+		} flush;
 	} data;
 	
 } rs__req_t;
@@ -138,6 +182,11 @@ typedef struct {
 	// over UDP).
 	uv_buf_t packet;
 	
+	// Payload transmitted immediately after the packet buffer above, pointing
+	// directly into the user's buffer to avoid copying it into the packet buffer
+	// (len is 0 when the payload was packed into the packet buffer instead).
+	uv_buf_t payload;
+	
 	// The current UDP send request (or NULL if the send operation is complete)
 	uv_udp_send_t send_req;
 	
@@ -196,6 +245,13 @@ typedef struct {
 			
 			// Callback function to call on completion/error.
 			rs_rw_cb cb;
+			
+			// Set when the request has completed but its callback is waiting for
+			// this slot's send request to complete (since the send may still read
+			// from the user's buffer). The arguments for the callback are also kept.
+			bool cb_pending;
+			int cb_error;
+			uint16_t cb_cmd_rc;
 		} rw;
 	} data;
 	
@@ -206,6 +262,10 @@ struct rs_conn {
 	// Maximum number of bytes in an SCP packet's data field
 	size_t scp_data_length;
 	
+	// The scp_data_length supplied to rs_init which the packet buffers are sized
+	// for (and thus the largest allowed scp_data_length)
+	size_t max_scp_data_length;
+	
 	// Number of msec to wait before retransmitting a packet
 	uint64_t timeout;
 	
@@ -219,8 +279,9 @@ struct rs_conn {
 	// The libuv event loop this connection lives in
 	uv_loop_t *loop;
 	
-	// The address to send requests to
-	const struct sockaddr *addr;
+	// The address to send requests to (a copy of the address supplied to
+	// rs_init)
+	struct sockaddr_storage addr;
 	
 	// The UDP connection handle used for this connection
 	uv_udp_t udp_handle;
@@ -229,6 +290,14 @@ struct rs_conn {
 	// freeing can occur)
 	bool udp_handle_closed;
 	
+	// The buffer into which all incoming datagrams are received. This buffer has
+	// space for as many datagrams (of RS__RECV_DGRAM_SIZE bytes each) as may be
+	// received at once: up to RS__RECV_MAX_DGRAMS when recvmmsg is in use and
+	// one otherwise. Responses are copied out of this buffer (into the user's
+	// buffers) before any more datagrams are received and so a single buffer is
+	// reused for every datagram.
+	uv_buf_t recv_buf;
+	
 	// Request queue containing rs__req_t entries representing SCP packets or bulk
 	// reads/writes which have not yet been handled.
 	rs__q_t *request_queue;
@@ -236,6 +305,10 @@ struct rs_conn {
 	// An array of n_outstanding outstanding packet transmission attempt states.
 	rs__outstanding_t *outstanding;
 	
+	// A single block of memory holding the packet buffers of all n_outstanding
+	// outstanding slots (each slot's packet.base points into this block).
+	char *packet_bufs;
+	
 	// Counter used to assign packet sequence numbers. Contains the next value to
 	// be assigned.
 	uint16_t next_seq_num;
@@ -244,6 +317,18 @@ struct rs_conn {
 	// value to be assigned.
 	unsigned int next_rw_id;
 	
+	// A flag which is set while rs__process_request_queue is running (or while
+	// rs__cancel_outstanding or rs__process_response is running, each of which
+	// processes the queue once when it completes). Calls made while it is set
+	// (e.g. from user callbacks or cancellations triggered by processing the
+	// queue) return immediately since the running call will re-examine the queue
+	// before returning.
+	bool processing_request_queue;
+	
+	// Set by calls to rs__process_request_queue which were coalesced into the
+	// running call, indicating that outstanding slots may have been freed.
+	bool request_queue_dirty;
+	
 	// A flag which indicates that this structure should be freed as soon as
 	// possible.
 	bool free;
@@ -256,6 +341,9 @@ struct rs_conn {
 
 /**
  * If and outstanding slots are available, process commands from the queue.
+ *
+ * This function is not re-entrant: calls made while it is already running
+ * return immediately and the queue is instead re-examined by the running call.
  */
 void rs__process_request_queue(rs_conn_t *conn);
 
@@ -286,6 +374,37 @@ void rs__cancel_outstanding(rs_conn_t *conn, rs__outstanding_t *os,
                             int error, uint16_t cmd_rc);
 
 
+/**
+ * Call the user callback of the read/write request in the given outstanding
+ * slot, indicating that it has completed with the specified error and cmd_rc.
+ *
+ * Since write payloads are sent directly from the user's buffer, if any slot
+ * of the same write still has a send request in progress, the callback is
+ * instead deferred until the last of these send requests complete (or until
+ * rs_free is called). Once a callback has been deferred, the request is
+ * complete and any further completions of it are ignored.
+ */
+void rs__complete_rw(rs_conn_t *conn, rs__outstanding_t *os,
+                     int error, uint16_t cmd_rc);
+
+
+/**
+ * Determine whether the given outstanding slot holds a read/write callback
+ * which was deferred by rs__complete_rw.
+ */
+bool rs__deferred_rw_cb_pending(const rs__outstanding_t *os);
+
+
+/**
+ * Call the read/write callback deferred onto the given outstanding slot (if
+ * any). The slot is released first since the callback may make new requests
+ * which reuse it.
+ *
+ * @returns True if a deferred callback was called.
+ */
+bool rs__flush_deferred_rw_cb(rs_conn_t *conn, rs__outstanding_t *os);
+
+
 /**
  * Cancel a request from the request queue.
  *
@@ -325,8 +444,22 @@ bool rs__process_queued_rw(rs_conn_t *conn,
                            rs__outstanding_t *os);
 
 
+/**
+ * Used by rs__process_request_queue. Processes a flush request.
+ *
+ * The request must be of type RS__REQ_FLUSH and at the head of the queue.
+ *
+ * @returns true if all earlier requests had completed and so the flush was
+ *          removed from the queue and its callback called, false if the flush
+ *          must continue to wait.
+ */
+bool rs__process_queued_flush(rs_conn_t *conn, rs__req_t *req);
+
+
 /**
  * Callback function to allocate memory in advance of an SCP packet arriving.
+ *
+ * Always supplies the connection's receive buffer.
  */
 void rs__udp_recv_alloc_cb(uv_handle_t *handle,
                            size_t suggested_size, uv_buf_t *buf);
@@ -337,7 +470,8 @@ void rs__udp_recv_alloc_cb(uv_handle_t *handle,
  *
  * If an outstanding slot with a matching sequence number is found,
  * rs__process_response will be called with the response and the UDP data (which
- * will be freed as soon as rs__process_response returns).
+ * will be overwritten by the next datagram to arrive once rs__process_response
+ * returns).
  */
 void rs__udp_recv_cb(uv_udp_t *handle,
                      ssize_t nread, const uv_buf_t *buf,
@@ -54,6 +54,11 @@ rs__process_queued_scp_packet(rs_conn_t *conn,
 	// Update the length of the outstanding packet (including the two padding
 	// bytes)
 	os->packet.len = packet.len + 2;
+	
+	// The payload is copied into the packet since the user's data buffer is also
+	// used for the response.
+	os->payload.base = NULL;
+	os->payload.len = 0;
 }
 
 
@@ -81,6 +86,7 @@ rs__process_queued_rw(rs_conn_t *conn,
 	
 	// Record the callback (and its data)
 	os->data.rw.cb = req->data.rw.cb;
+	os->data.rw.cb_pending = false;
 	os->cb_data = req->cb_data;
 	
 	// Work out the type of read/write request based on the address and length
@@ -90,35 +96,28 @@ rs__process_queued_rw(rs_conn_t *conn,
 	uv_buf_t packet;
 	packet.base = os->packet.base + 2;
 	
-	// Pack the packet ready for transmission
-	if (os->type == RS__REQ_READ) {
-		uv_buf_t empty;
-		empty.base = NULL;
-		empty.len = 0;
-		rs__pack_scp_packet(&packet,
-		                    conn->scp_data_length,
-		                    req->dest_addr,
-		                    req->dest_cpu,
-		                    RS__SCP_CMD_READ,
-		                    os->seq_num,
-		                    3,
-		                    address,
-		                    os->data.rw.data.len,
-		                    req_type,
-		                    empty);
-	} else {
-		rs__pack_scp_packet(&packet,
-		                    conn->scp_data_length,
-		                    req->dest_addr,
-		                    req->dest_cpu,
-		                    RS__SCP_CMD_WRITE,
-		                    os->seq_num,
-		                    3,
-		                    address,
-		                    os->data.rw.data.len,
-		                    req_type,
-		                    os->data.rw.data);
-	}
+	// Pack the packet header ready for transmission. When writing, the payload
+	// is sent directly from the user's buffer rather than being copied into the
+	// packet buffer.
+	uv_buf_t empty;
+	empty.base = NULL;
+	empty.len = 0;
+	rs__pack_scp_packet(&packet,
+	                    conn->scp_data_length,
+	                    req->dest_addr,
+	                    req->dest_cpu,
+	                    (os->type == RS__REQ_READ) ? RS__SCP_CMD_READ
+	                                               : RS__SCP_CMD_WRITE,
+	                    os->seq_num,
+	                    3,
+	                    address,
+	                    os->data.rw.data.len,
+	                    req_type,
+	                    empty);
+	if (os->type == RS__REQ_READ)
+		os->payload = empty;
+	else
+		os->payload = os->data.rw.data;
 	
 	// Update the length of the outstanding packet (including the two padding
 	// bytes)
@@ -129,29 +128,93 @@ rs__process_queued_rw(rs_conn_t *conn,
 }
 
 
+bool
+rs__process_queued_flush(rs_conn_t *conn, rs__req_t *req)
+{
+	int i;
+	
+	// Wait until every earlier request has completed. Slots which have been
+	// cancelled but are waiting for their send request to finish have already
+	// had their callbacks called unless a read/write callback was deferred until
+	// the send completes.
+	for (i = 0; i < conn->n_outstanding; i++) {
+		rs__outstanding_t *os = conn->outstanding + i;
+		if (os->active && !os->cancelled)
+			return false;
+		if (rs__deferred_rw_cb_pending(os))
+			return false;
+	}
+	
+	// Take a copy of the callback since the queue entry may be reused by any
+	// request made from within the callback
+	rs_flush_cb cb = req->data.flush.cb;
+	void *cb_data = req->cb_data;
+	rs__q_remove(conn->request_queue);
+	
+	cb(conn, 0, cb_data);
+	
+	return true;
+}
+
+
 void
 rs__process_request_queue(rs_conn_t *conn)
 {
 	int i;
 	
+	// Coalesce calls made while the queue is already being processed (e.g. by a
+	// callback). The loop below re-examines the queue after every request it
+	// handles so nothing is missed.
+	if (conn->processing_request_queue) {
+		conn->request_queue_dirty = true;
+		return;
+	}
+	conn->processing_request_queue = true;
+	conn->request_queue_dirty = false;
+	
+	// Slots before this index were found to be busy during this pass. Slots only
+	// become free again during a pass as a result of a (coalesced) nested call,
+	// in which case the search starts from the first slot again.
+	unsigned int first_free_slot = 0;
+	
 	// Process as many packets as possible before running out
 	while (1) {
+		if (conn->request_queue_dirty) {
+			conn->request_queue_dirty = false;
+			first_free_slot = 0;
+		}
+		
+		// Once freeing has begun, queued requests are only ever cancelled
+		if (conn->free)
+			break;
+		
+		// Find a request to send
+		rs__req_t *req = (rs__req_t *)rs__q_peek(conn->request_queue);
+		if (!req)
+			break;
+		
+		// Flushes complete (without using an outstanding slot) once no slot is
+		// still awaiting a response
+		if (req->type == RS__REQ_FLUSH) {
+			if (!rs__process_queued_flush(conn, req))
+				break;
+			continue;
+		}
+		
 		// Find a free outstanding slot
 		rs__outstanding_t *os = NULL;
-		for (i = 0; i < conn->n_outstanding; i++) {
+		for (i = first_free_slot; i < conn->n_outstanding; i++) {
 			if (!conn->outstanding[i].active &&
 			    !conn->outstanding[i].send_req_active) {
 				os = &(conn->outstanding[i]);
 				break;
 			}
 		}
+		first_free_slot = i;
 		
-		// Find a request to send
-		rs__req_t *req = (rs__req_t *)rs__q_peek(conn->request_queue);
-		
-		// Stop if there is no available slot or request
-		if (!os || !req)
-			return;
+		// Stop if there is no available slot
+		if (!os)
+			break;
 		
 		// Place the request int the outstanding slot
 		switch (req->type) {
@@ -165,9 +228,15 @@ rs__process_request_queue(rs_conn_t *conn)
 				if (rs__process_queued_rw(conn, req, os))
 					rs__q_remove(conn->request_queue);
 				break;
+			
+			case RS__REQ_FLUSH:
+				// Handled above
+				break;
 		}
 		
 		// Transmit the packet
 		rs__attempt_transmission(conn, os);
 	}
+	
+	conn->processing_request_queue = false;
 }
@@ -100,22 +100,32 @@ rs__process_response_rw(rs_conn_t *conn, rs__outstanding_t *os,
 		last_outstanding = false;
 	
 	// If this was the last outstanding command, call the users callback.
-	if (last_outstanding) {
-		os->data.rw.cb(conn, false,
-		               cmd_rc,
-		               os->data.rw.orig_data,
-		               os->cb_data);
-	}
+	if (last_outstanding)
+		rs__complete_rw(conn, os, 0, cmd_rc);
 }
 
 
 void
 rs__process_response(rs_conn_t *conn, rs__outstanding_t *os, uv_buf_t buf)
 {
+	// Ignore responses to packets which have been cancelled but whose slot is
+	// waiting for its send request to complete: the request has already failed
+	// (and its callback been dealt with) so a late response must not complete it
+	// again.
+	if (os->cancelled)
+		return;
+	
 	// Stop the timeout timer
 	if (uv_is_active((uv_handle_t *)&(os->timer_handle)))
 		uv_timer_stop(&(os->timer_handle));
 	
+	// Hold off processing the request queue until this slot has been marked as
+	// inactive: the user callbacks (and cancellations) below may otherwise cause
+	// a new request to be placed in this slot which would then be wrongly marked
+	// as inactive.
+	bool was_processing_request_queue = conn->processing_request_queue;
+	conn->processing_request_queue = true;
+	
 	// Deal with the packet depending on its type
 	switch (os->type) {
 		case RS__REQ_SCP_PACKET:
@@ -126,10 +136,17 @@ rs__process_response(rs_conn_t *conn, rs__outstanding_t *os, uv_buf_t buf)
 		case RS__REQ_WRITE:
 			rs__process_response_rw(conn, os, buf);
 			break;
+		
+		case RS__REQ_FLUSH:
+			// Never placed in an outstanding slot
+			break;
 	}
 	
-	// Mark this outstanding slot as inactive again and trigger queue processing
-	// since we just freed up an outstanding slot.
-	os->active = false;
+	// Mark this outstanding slot as inactive again (unless it was cancelled while
+	// its send request is still active, in which case rs__udp_send_cb will do so)
+	// and trigger queue processing since we just freed up an outstanding slot.
+	if (!os->cancelled)
+		os->active = false;
+	conn->processing_request_queue = was_processing_request_queue;
 	rs__process_request_queue(conn);
 }
@@ -39,6 +39,8 @@ rs__q_init(size_t data_size)
 	if (!q) return NULL;
 	
 	q->data_size = data_size;
+	q->length = 0;
+	q->max_length = 0;
 	
 	// Allocate the initial block of queue entries
 	q->blocks = malloc(sizeof(rs__q_block_t));
@@ -68,43 +70,96 @@ rs__q_init(size_t data_size)
 }
 
 
+/**
+ * Enlarge the queue by inserting a new block of the given number of (empty)
+ * entries immediately after the head.
+ *
+ * @returns 0 on success, non-zero on failure (leaving the queue unchanged).
+ */
+static int
+rs__q_grow(rs__q_t *q, size_t size)
+{
+	// Allocate storage for the new block
+	rs__q_block_t *new_block = malloc(sizeof(rs__q_block_t));
+	if (!new_block) return -1;
+	new_block->size = size;
+	new_block->block = calloc(new_block->size, q->data_size);
+	if (!new_block->block) {
+		// Fail
+		free(new_block);
+		return -1;
+	}
+	
+	// Initialise the new block and insert it into the queue's linked list
+	rs__q_block_init(q, new_block);
+	BLOCK_ENTRY(q, new_block, new_block->size - 1)->next = q->head->next;
+	q->head->next = (rs__q_entry_t *)new_block->block;
+	
+	// Insert the new block into to the linked list of blocks
+	new_block->next = q->blocks;
+	q->blocks = new_block;
+	
+	return 0;
+}
+
+
 void *
 rs__q_insert(rs__q_t *q)
 {
+	// Refuse new entries once the queue is at its maximum length
+	if (q->max_length && q->length >= q->max_length)
+		return NULL;
+	
 	// Allocate more buffer space if the queue would become full upon inserting
-	// this item
-	if (!q->head->next->empty) {
-		// Allocate storage for the new block, making the new allocation twice as
-		// large as the last one.
-		rs__q_block_t *new_block = malloc(sizeof(rs__q_block_t));
-		if (!new_block) return NULL;
-		new_block->size = q->blocks->size * 2;
-		new_block->block = calloc(new_block->size, q->data_size);
-		if (!new_block->block) {
-			// Fail
-			free(new_block);
-			return NULL;
-		}
-		
-		// Initialise the new block and insert it into the queue's linked list
-		rs__q_block_init(q, new_block);
-		BLOCK_ENTRY(q, new_block, new_block->size - 1)->next = q->head->next;
-		q->head->next = (rs__q_entry_t *)new_block->block;
-		
-		// Insert the new block into to the linked list of blocks
-		new_block->next = q->blocks;
-		q->blocks = new_block;
-	}
+	// this item, making the new allocation twice as large as the last one.
+	if (!q->head->next->empty && rs__q_grow(q, q->blocks->size * 2))
+		return NULL;
 	
 	// Advance the head of the queue and return the entry which was previously at
 	// the head.
 	rs__q_entry_t *entry = q->head;
 	entry->empty = false;
 	q->head = q->head->next;
+	q->length++;
 	return (void *)entry;
 }
 
 
+int
+rs__q_reserve(rs__q_t *q, size_t n)
+{
+	// Refuse reservations which would exceed the maximum length
+	if (q->max_length && q->length + n > q->max_length)
+		return -1;
+	
+	// Count the entries which may be inserted without growing the queue (the
+	// head must always point to an empty entry, hence the "- 1").
+	size_t capacity = 0;
+	rs__q_block_t *block;
+	for (block = q->blocks; block; block = block->next)
+		capacity += block->size;
+	size_t n_free = capacity - q->length - 1;
+	
+	// Grow the queue in a single step to fit all of the reserved entries
+	if (n_free < n) {
+		size_t size = q->blocks->size * 2;
+		if (size < n - n_free)
+			size = n - n_free;
+		if (rs__q_grow(q, size))
+			return -1;
+	}
+	
+	return 0;
+}
+
+
+void
+rs__q_set_max_length(rs__q_t *q, size_t max_length)
+{
+	q->max_length = max_length;
+}
+
+
 void *
 rs__q_remove(rs__q_t *q)
 {
@@ -114,6 +169,7 @@ rs__q_remove(rs__q_t *q)
 	if (!entry->empty) {
 		entry->empty = true;
 		q->tail = q->tail->next;
+		q->length--;
 		return (void *)entry;
 	} else {
 		return NULL;
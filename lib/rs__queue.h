@@ -68,6 +68,12 @@ typedef struct rs__q {
 	
 	// A linked list of blocks of memory allocated to support the queue
 	rs__q_block_t *blocks;
+	
+	// The number of entries currently in the queue
+	size_t length;
+	
+	// The maximum number of entries allowed in the queue (or 0 if unlimited)
+	size_t max_length;
 } rs__q_t;
 
 
@@ -86,11 +92,34 @@ rs__q_t *rs__q_init(size_t data_size);
 /**
  * Attempt to insert an entry into the queue.
  *
- * Returns a pointer to an entry in the queue or NULL on failure.
+ * Returns a pointer to an entry in the queue or NULL on failure (including
+ * when the queue already holds its maximum number of entries).
  */
 void *rs__q_insert(rs__q_t *q);
 
 
+/**
+ * Ensure that the next n entries inserted into the queue cannot fail.
+ *
+ * Allocates any additional space required to hold n more entries in a single
+ * step and checks that the queue's maximum length permits n more entries.
+ *
+ * @returns 0 on success, non-zero if the space could not be allocated or the
+ *          queue would exceed its maximum length (leaving the queue unchanged).
+ */
+int rs__q_reserve(rs__q_t *q, size_t n);
+
+
+/**
+ * Set the maximum number of entries the queue may hold.
+ *
+ * @param max_length The maximum number of entries or 0 for no limit. If the
+ *                   queue already holds more entries, these remain in the queue
+ *                   but no more may be inserted until enough are removed.
+ */
+void rs__q_set_max_length(rs__q_t *q, size_t max_length);
+
+
 /**
  * Attempt to remove an entry into the queue.
  *
@@ -33,18 +33,6 @@ typedef struct {
 } sdp_scp_header_t;
 
 
-rs__scp_rw_type_t
-rs__scp_rw_type(uint32_t address, uint32_t length)
-{
-	if (address % 4 == 0 && length % 4 == 0)
-		return RS__RW_TYPE_WORD;
-	else if (address % 2 == 0 && length % 2 == 0)
-		return RS__RW_TYPE_SHORT;
-	else
-		return RS__RW_TYPE_BYTE;
-}
-
-
 void
 rs__pack_scp_packet(uv_buf_t *buf,
                     size_t scp_data_length,
@@ -91,14 +79,6 @@ rs__pack_scp_packet(uv_buf_t *buf,
 }
 
 
-uint16_t
-rs__unpack_scp_packet_seq_num(uv_buf_t buf)
-{
-	sdp_scp_header_t *header = (sdp_scp_header_t *)buf.base;
-	return header->seq_num;
-}
-
-
 void
 rs__unpack_scp_packet(uv_buf_t buf,
                       uint16_t *cmd_rc,
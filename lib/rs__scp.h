@@ -6,6 +6,7 @@
 #define RS__SCP_H
 
 #include <stdint.h>
+#include <string.h>
 
 #include <uv.h>
 
@@ -54,9 +55,19 @@ typedef enum {
  * Given an address and read/write length, select the appropriate read/write
  * type.
  *
- * Chooses the largest unit size suitable for the job.
+ * Chooses the largest unit size suitable for the job. Defined inline since it
+ * is called once for every packet a read/write is split into.
  */
-rs__scp_rw_type_t rs__scp_rw_type(uint32_t address, uint32_t length);
+static inline rs__scp_rw_type_t
+rs__scp_rw_type(uint32_t address, uint32_t length)
+{
+	if (address % 4 == 0 && length % 4 == 0)
+		return RS__RW_TYPE_WORD;
+	else if (address % 2 == 0 && length % 2 == 0)
+		return RS__RW_TYPE_SHORT;
+	else
+		return RS__RW_TYPE_BYTE;
+}
 
 
 /**
@@ -95,10 +106,20 @@ void rs__pack_scp_packet(uv_buf_t *buf,
  * Warning: Does not check that the buffer is long enough! It is the caller's
  * responsibility to check that the packet is long enough to be an SCP packet.
  *
+ * Defined inline since it is called for every received packet, before the
+ * rest of the packet is unpacked (and only if it matches an outstanding
+ * request).
+ *
  * @param buf The buffer containing the packet.
  * @returns The sequeunce number in the packet.
  */
-uint16_t rs__unpack_scp_packet_seq_num(uv_buf_t buf);
+static inline uint16_t
+rs__unpack_scp_packet_seq_num(uv_buf_t buf)
+{
+	uint16_t seq_num;
+	memcpy(&seq_num, buf.base + RS__SDP_HEADER_LENGTH + 2, sizeof(seq_num));
+	return seq_num;
+}
 
 
 /**
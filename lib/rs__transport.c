@@ -26,12 +26,16 @@ rs__attempt_transmission(rs_conn_t *conn, rs__outstanding_t *os)
 		return;
 	
 	if (++os->n_tries <= conn->n_tries) {
-		// Attempt to transmit
+		// Attempt to transmit. The header and any payload sent by reference are
+		// gathered into a single datagram (libuv copies the buffer descriptors).
+		uv_buf_t bufs[2];
+		bufs[0] = os->packet;
+		bufs[1] = os->payload;
 		os->send_req_active = true;
 		int err = uv_udp_send(&(os->send_req),
 		                      &(conn->udp_handle),
-		                      &(os->packet), 1,
-		                      conn->addr,
+		                      bufs, (os->payload.len > 0) ? 2 : 1,
+		                      (const struct sockaddr *)&(conn->addr),
 		                      rs__udp_send_cb);
 		if (err) {
 			// Transmission failiure: clean up
@@ -66,6 +70,17 @@ rs__udp_send_cb(uv_udp_send_t *req, int status)
 	// Record that we've recieved the callback for the request
 	os->send_req_active = false;
 	
+	// If a read/write's callback was waiting for this send to complete, the
+	// slot is finished with: release it and call the callback (or defer it
+	// further until any remaining sends complete).
+	if (rs__flush_deferred_rw_cb(conn, os)) {
+		if (conn->free)
+			rs_free(conn, NULL, NULL);
+		else
+			rs__process_request_queue(conn);
+		return;
+	}
+	
 	// If we were waiting on this callback before freeing, we can now re-attempt
 	// the free and quit.
 	if (conn->free) {
@@ -103,17 +118,81 @@ rs__udp_send_cb(uv_udp_send_t *req, int status)
 }
 
 
+void
+rs__complete_rw(rs_conn_t *conn, rs__outstanding_t *os,
+                int error, uint16_t cmd_rc)
+{
+	int i;
+	
+	// If any packet of this write is still being sent, libuv may yet read its
+	// payload from the user's buffer so defer the callback until the send request
+	// completes. (Reads never send from the user's buffer and once freeing has
+	// begun the socket is closed so nothing more will be sent.)
+	if (os->type == RS__REQ_WRITE && !conn->free) {
+		rs__outstanding_t *defer_os = NULL;
+		for (i = 0; i < conn->n_outstanding; i++) {
+			rs__outstanding_t *other_os = conn->outstanding + i;
+			if (other_os->type != os->type ||
+			    other_os->data.rw.id != os->data.rw.id)
+				continue;
+			
+			// The request has already completed and its callback is waiting: don't
+			// report it again (or replace the result it will be called with).
+			if (rs__deferred_rw_cb_pending(other_os))
+				return;
+			
+			if (other_os->send_req_active && !defer_os)
+				defer_os = other_os;
+		}
+		
+		if (defer_os) {
+			defer_os->data.rw.cb_pending = true;
+			defer_os->data.rw.cb_error = error;
+			defer_os->data.rw.cb_cmd_rc = cmd_rc;
+			return;
+		}
+	}
+	
+	os->data.rw.cb(conn, error,
+	               cmd_rc, os->data.rw.orig_data,
+	               os->cb_data);
+}
+
+
+bool
+rs__deferred_rw_cb_pending(const rs__outstanding_t *os)
+{
+	return (os->type == RS__REQ_READ || os->type == RS__REQ_WRITE) &&
+	       os->data.rw.cb_pending;
+}
+
+
+bool
+rs__flush_deferred_rw_cb(rs_conn_t *conn, rs__outstanding_t *os)
+{
+	if (!rs__deferred_rw_cb_pending(os))
+		return false;
+	
+	os->data.rw.cb_pending = false;
+	os->active = false;
+	os->cancelled = false;
+	rs__complete_rw(conn, os, os->data.rw.cb_error, os->data.rw.cb_cmd_rc);
+	
+	return true;
+}
+
+
 void
 rs__udp_recv_alloc_cb(uv_handle_t *handle,
                       size_t suggested_size, uv_buf_t *buf)
 {
-	// XXX: Just use malloc for now...
-	buf->base = malloc(suggested_size);
-	
-	if (buf->base)
-		buf->len = suggested_size;
-	else
-		buf->len = 0;
+	// Datagrams are always received into the connection's receive buffer: its
+	// contents are handled by rs__udp_recv_cb before any more datagrams arrive.
+	// Note that when several datagrams are received at once, rs__udp_recv_cb is
+	// called once per datagram and then a final time with nread == 0 (which is
+	// ignored).
+	rs_conn_t *conn = (rs_conn_t *)(handle->data);
+	*buf = conn->recv_buf;
 }
 
 
@@ -150,8 +229,4 @@ rs__udp_recv_cb(uv_udp_t *handle,
 			}
 		}
 	}
-	
-	// Free receive buffer
-	if (buf->base)
-		free(buf->base);
 }
@@ -290,6 +290,8 @@ mm__new_resp(mm_t *mm, mm_req_t *req)
 	uv_timer_init(mm->loop, &(resp->timer_handle));
 	resp->timer_handle_closed = false;
 	resp->udp_send_active = 0;
+	resp->buf.base = NULL;
+	resp->buf.len = 0;
 	
 	// Set up timer handle pointer to the response object
 	resp->timer_handle.data = (void *)resp;
@@ -389,25 +391,26 @@ mm__timer_cb(uv_timer_t *timer_handle)
 	mm_req_t *req = resp->req;
 	mm_t *mm = req->mm;
 	
-	uv_buf_t buf;
-	buf.len = 0;
+	uv_buf_t *buf = &(resp->buf);
+	buf->len = 0;
 	
 	// Genetate the appropriate packet in response
 	switch (MM__CMD_RC(req->buf.base)) {
 		case RS__SCP_CMD_READ:
-			mm__pack_response_read(mm, req, resp, &buf);
+			mm__pack_response_read(mm, req, resp, buf);
 			break;
 		
 		case RS__SCP_CMD_WRITE:
-			mm__pack_response_write(mm, req, resp, &buf);
+			mm__pack_response_write(mm, req, resp, buf);
 			break;
 		
 		default:
-			mm__pack_response_generic(mm, req, resp, &buf);
+			mm__pack_response_generic(mm, req, resp, buf);
 			break;
 	}
 	
-	// Send the packet and all its duplicates
+	// Send the packet and all its duplicates. All sends share the response's
+	// buffer which is freed once the last of them completes.
 	int i;
 	for (i = 0; i < MM__N_DUPLICATES(req->buf.base) + 1; i++) {
 		// Reserve memory for the UDP send state
@@ -415,14 +418,7 @@ mm__timer_cb(uv_timer_t *timer_handle)
 		if (!send) abort();
 		send->resp = resp;
 		send->udp_send_req.data = (void *)send;
-		
-		// Copy the response packet for this request
-		if (buf.len) {
-			send->buf.base = malloc(buf.len);
-			if (!send->buf.base) abort();
-			memcpy(send->buf.base, buf.base, buf.len);
-		}
-		send->buf.len = buf.len;
+		send->buf = *buf;
 		
 		// Send the request
 		resp->udp_send_active++;
@@ -430,9 +426,6 @@ mm__timer_cb(uv_timer_t *timer_handle)
 		if (uv_udp_send(&(send->udp_send_req), &(mm->udp_handle),
 		                &(send->buf), 1, &(resp->addr), mm__send_cb)) abort();
 	}
-	
-	// Free the original copy of the response packet
-	free(buf.base);
 }
 
 
@@ -549,10 +542,11 @@ mm__send_cb(uv_udp_send_t *send_req, int status)
 	mm_resp_t *resp = send->resp;
 	mm_t *mm = resp->req->mm;
 	
-	resp->udp_send_active--;
-	
-	// Free the send buffer (and request handler)
-	free(send->buf.base);
+	// Free the request handler (and the shared send buffer after the last send)
+	if (--resp->udp_send_active == 0) {
+		free(resp->buf.base);
+		resp->buf.base = NULL;
+	}
 	free(send);
 	
 	// Complete the free if required
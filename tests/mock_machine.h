@@ -79,7 +79,7 @@ struct mm_resp {
 	// The address to send the response back to
 	struct sockaddr addr;
 	
-	// The data to be sent
+	// The data to be sent (shared by every duplicate of the response)
 	uv_buf_t buf;
 	
 	// A counter incremented when a send has been initiated and decremented when the
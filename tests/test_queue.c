@@ -103,6 +103,77 @@ START_TEST (test_buffer_growth)
 END_TEST
 
 
+START_TEST (test_max_length)
+{
+	// Make sure that no more than the maximum number of entries can be inserted
+	const int max_length = RS__Q_FIRST_BLOCK_SIZE + 2;
+	int i;
+	
+	rs__q_set_max_length(q, max_length);
+	
+	for (i = 0; i < max_length; i++)
+		ck_assert(rs__q_insert(q));
+	ck_assert(rs__q_insert(q) == NULL);
+	ck_assert_uint_eq(q->length, max_length);
+	
+	// Removing an entry should make space for one more
+	ck_assert(rs__q_remove(q));
+	ck_assert(rs__q_insert(q));
+	ck_assert(rs__q_insert(q) == NULL);
+	
+	// Removing the limit should allow more entries again
+	rs__q_set_max_length(q, 0);
+	ck_assert(rs__q_insert(q));
+	ck_assert_uint_eq(q->length, max_length + 1);
+	
+	// Empty the queue
+	for (i = 0; i < max_length + 1; i++)
+		ck_assert(rs__q_remove(q));
+	ck_assert(rs__q_remove(q) == NULL);
+	ck_assert_uint_eq(q->length, 0);
+}
+END_TEST
+
+
+START_TEST (test_reserve)
+{
+	// Make sure that reserved entries are allocated in one step and that the
+	// reserved number of insertions then succeed without further allocation.
+	const int num = RS__Q_FIRST_BLOCK_SIZE * 10;
+	int i;
+	
+	// Reserving space which is already available shouldn't allocate anything
+	ck_assert(!rs__q_reserve(q, RS__Q_FIRST_BLOCK_SIZE - 1));
+	ck_assert(q->blocks->next == NULL);
+	
+	// Reserving more should allocate exactly one new block
+	ck_assert(!rs__q_reserve(q, num));
+	ck_assert(q->blocks->next);
+	ck_assert(q->blocks->next->next == NULL);
+	rs__q_block_t *blocks = q->blocks;
+	
+	for (i = 0; i < num; i++) {
+		my_type_t *e = (my_type_t *)rs__q_insert(q);
+		ck_assert(e);
+		e->value = i;
+	}
+	ck_assert(q->blocks == blocks);
+	
+	// Entries should come out in order
+	for (i = 0; i < num; i++)
+		ck_assert_int_eq(((my_type_t *)rs__q_remove(q))->value, i);
+	ck_assert(rs__q_remove(q) == NULL);
+	
+	// Reservations beyond the maximum length should fail without effect
+	rs__q_set_max_length(q, 2);
+	ck_assert(rs__q_insert(q));
+	ck_assert(rs__q_reserve(q, 2));
+	ck_assert(!rs__q_reserve(q, 1));
+	ck_assert_uint_eq(q->length, 1);
+}
+END_TEST
+
+
 START_TEST (test_varying_size)
 {
 	// Go through several cycles of insertions and removals of varying sizes.
@@ -151,6 +222,8 @@ make_queue_suite(void)
 	tcase_add_test(tc_core, test_empty);
 	tcase_add_test(tc_core, test_single_insertion);
 	tcase_add_test(tc_core, test_buffer_growth);
+	tcase_add_test(tc_core, test_max_length);
+	tcase_add_test(tc_core, test_reserve);
 	tcase_add_test(tc_core, test_varying_size);
 	
 	// Add each test case to the suite
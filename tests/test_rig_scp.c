@@ -20,6 +20,7 @@
 #include "mock_machine.h"
 
 #include "rs.h"
+#include "rs__internal.h"
 
 
 /******************************************************************************
@@ -314,6 +315,47 @@ rw_cb(rs_conn_t *conn,
 }
 
 
+/**
+ * A data structure to hold details of callbacks from the rig scp library's
+ * rs_flush function. To be passed as data to the ready-made callback flush_cb.
+ */
+struct flush_cb_data;
+typedef struct flush_cb_data flush_cb_data_t;
+struct flush_cb_data {
+	cb_data_t generic_info;
+	
+	// Store a copy of the arguments supplied
+	rs_conn_t *conn;
+	int error;
+	
+	// The callback data for requests which must complete before the flush. The
+	// number of these which had not been called when the flush completed is
+	// recorded.
+	send_scp_cb_data_t *preceding;
+	unsigned int n_preceding;
+	unsigned int n_preceding_incomplete;
+};
+
+
+void
+flush_cb(rs_conn_t *conn,
+         int error,
+         void *cb_data)
+{
+	flush_cb_data_t *d = (flush_cb_data_t *)cb_data;
+	d->conn = conn;
+	d->error = error;
+	
+	unsigned int i;
+	d->n_preceding_incomplete = 0;
+	for (i = 0; i < d->n_preceding; i++)
+		if (!d->preceding[i].generic_info.n_calls)
+			d->n_preceding_incomplete++;
+	
+	d->generic_info.n_calls++;
+}
+
+
 /******************************************************************************
  * Test fixture setup/teardown
  ******************************************************************************/
@@ -345,8 +387,10 @@ static void setup(void) {
 
 static void teardown(void) {
 	// No need for a callback since this will be the last thing in the event loop
-	// and thus the loop will end itself.
-	rs_free(conn, NULL, NULL);
+	// and thus the loop will end itself. (Some tests free the connection
+	// themselves.)
+	if (conn)
+		rs_free(conn, NULL, NULL);
 	conn = NULL;
 	
 	mm_free(mm);
@@ -378,6 +422,193 @@ START_TEST (test_empty)
 END_TEST
 
 
+/**
+ * Make sure that error names/messages are written into the supplied buffer,
+ * both for Rig SCP and libuv errors, and truncated if necessary.
+ */
+START_TEST (test_err_name_r)
+{
+	char buf[64];
+	
+	ck_assert(rs_err_name_r(RS_ETIMEOUT, buf, sizeof(buf)) == buf);
+	ck_assert_str_eq(buf, rs_err_name(RS_ETIMEOUT));
+	ck_assert(rs_strerror_r(RS_ETIMEOUT, buf, sizeof(buf)) == buf);
+	ck_assert_str_eq(buf, rs_strerror(RS_ETIMEOUT));
+	
+	ck_assert(rs_err_name_r(UV_EINVAL, buf, sizeof(buf)) == buf);
+	ck_assert_str_eq(buf, rs_err_name(UV_EINVAL));
+	ck_assert(rs_strerror_r(UV_EINVAL, buf, sizeof(buf)) == buf);
+	ck_assert_str_eq(buf, rs_strerror(UV_EINVAL));
+	
+	// Truncated
+	ck_assert(rs_err_name_r(RS_EFREE, buf, 4) == buf);
+	ck_assert_str_eq(buf, "RS_");
+}
+END_TEST
+
+
+/**
+ * Read back the current send and receive buffer sizes of a connection's socket
+ * (libuv treats a size of zero as a query).
+ */
+static void
+get_socket_buffer_sizes(rs_conn_t *conn, int *send_size, int *recv_size)
+{
+	*send_size = 0;
+	*recv_size = 0;
+	ck_assert_int_eq(uv_send_buffer_size((uv_handle_t *)&(conn->udp_handle),
+	                                     send_size), 0);
+	ck_assert_int_eq(uv_recv_buffer_size((uv_handle_t *)&(conn->udp_handle),
+	                                     recv_size), 0);
+}
+
+/**
+ * Make sure that the socket buffer sizes can be changed and left unchanged.
+ * Since the kernel may round up the sizes given (e.g. Linux doubles them), the
+ * sizes read back are only required to be at least those requested.
+ */
+START_TEST (test_set_socket_buffer_sizes)
+{
+	int send_size;
+	int recv_size;
+	int new_send_size;
+	int new_recv_size;
+	
+	ck_assert_int_eq(rs_set_socket_buffer_sizes(conn, 16 * 1024, 16 * 1024), 0);
+	get_socket_buffer_sizes(conn, &send_size, &recv_size);
+	ck_assert_int_ge(send_size, 16 * 1024);
+	ck_assert_int_ge(recv_size, 16 * 1024);
+	
+	// Both sizes should grow
+	ck_assert_int_eq(rs_set_socket_buffer_sizes(conn, 64 * 1024, 64 * 1024), 0);
+	get_socket_buffer_sizes(conn, &new_send_size, &new_recv_size);
+	ck_assert_int_ge(new_send_size, 64 * 1024);
+	ck_assert_int_ge(new_recv_size, 64 * 1024);
+	ck_assert_int_gt(new_send_size, send_size);
+	ck_assert_int_gt(new_recv_size, recv_size);
+	send_size = new_send_size;
+	recv_size = new_recv_size;
+	
+	// Passing zero should leave both sizes unchanged
+	ck_assert_int_eq(rs_set_socket_buffer_sizes(conn, 0, 0), 0);
+	get_socket_buffer_sizes(conn, &new_send_size, &new_recv_size);
+	ck_assert_int_eq(new_send_size, send_size);
+	ck_assert_int_eq(new_recv_size, recv_size);
+	
+	// Negative sizes should be rejected, leaving both sizes unchanged
+	ck_assert_int_eq(rs_set_socket_buffer_sizes(conn, -1, 16 * 1024), UV_EINVAL);
+	ck_assert_int_eq(rs_set_socket_buffer_sizes(conn, 16 * 1024, -1), UV_EINVAL);
+	get_socket_buffer_sizes(conn, &new_send_size, &new_recv_size);
+	ck_assert_int_eq(new_send_size, send_size);
+	ck_assert_int_eq(new_recv_size, recv_size);
+	
+	// Each size may be changed independently
+	ck_assert_int_eq(rs_set_socket_buffer_sizes(conn, 0, 16 * 1024), 0);
+	get_socket_buffer_sizes(conn, &new_send_size, &new_recv_size);
+	ck_assert_int_eq(new_send_size, send_size);
+	ck_assert_int_ge(new_recv_size, 16 * 1024);
+	ck_assert_int_lt(new_recv_size, recv_size);
+}
+END_TEST
+
+
+/**
+ * Make sure that the connection parameters can be changed and that a reduced
+ * scp_data_length is used to split later writes.
+ */
+START_TEST (test_update_params)
+{
+	const size_t scp_data_length = MM_SCP_DATA_LENGTH / 2;
+	const size_t n_packets = 3;
+	const size_t length = scp_data_length * n_packets;
+	
+	size_t i;
+	
+	// The packet buffers can't be enlarged, packets must carry some data and
+	// n_tries must be at least one
+	ck_assert(rs_update_params(conn, MM_SCP_DATA_LENGTH + 1, TIMEOUT, N_TRIES));
+	ck_assert(rs_update_params(conn, 0, TIMEOUT, N_TRIES));
+	ck_assert(rs_update_params(conn, scp_data_length, TIMEOUT, 0));
+	
+	// Shrink the packet size
+	ck_assert(!rs_update_params(conn, scp_data_length, TIMEOUT, N_TRIES));
+	
+	// Get a reference to the memory block we're going to write to
+	mm_rw_t *rw = mm_get_rw(mm, 0);
+	
+	// Create a callback which we'll wait on for a reply
+	rw_cb_data_t cb_data;
+	wait_for_cb((cb_data_t *)&cb_data);
+	
+	// Set a buffer with some dummy data to write
+	unsigned char data_buf[length];
+	for (i = 0; i < length; i++)
+		data_buf[i] = (unsigned char)i;
+	uv_buf_t data;
+	data.base = (void *)data_buf;
+	data.len = length;
+	
+	// Write the data
+	uint32_t addr = (0u<<10 |  // The RW ID
+	                 255u<<16 | // No errors
+	                 255u<<24); // Respond to all the same speed
+	ck_assert(!rs_write(conn,
+	                    (1 << 8) | 1, // Respond after 1 msec and one attempt
+	                    0, // Send no duplicates
+	                    addr,
+	                    data,
+	                    rw_cb, &cb_data));
+	ck_assert(!wait_for_all_cb());
+	
+	// Check the write succeeded using the reduced packet size
+	ck_assert_uint_eq(cb_data.generic_info.n_calls, 1);
+	ck_assert(!cb_data.error);
+	ck_assert_uint_eq(rw->n_responses_sent, n_packets);
+	ck_assert(memcmp(rw->data, data_buf, length) == 0);
+	for (i = 0; i < n_packets; i++)
+		ck_assert_uint_eq(mm_get_req(mm, i)->buf.len,
+		                  RS__SIZEOF_SCP_PACKET(3, scp_data_length));
+}
+END_TEST
+
+
+/**
+ * Make sure that the connection keeps its own copy of the address supplied to
+ * rs_init.
+ */
+START_TEST (test_addr_copied)
+{
+	// Clobber the address the connection was created with
+	memset(&conn_addr, 0, sizeof(conn_addr));
+	
+	// Create a callback which we'll wait on for a reply
+	send_scp_cb_data_t cb_data;
+	wait_for_cb((cb_data_t *)&cb_data);
+	
+	// Create an empty payload
+	uv_buf_t data;
+	data.base = NULL;
+	data.len = 0;
+	
+	// Send a packet which will only get a response if it is sent to the mock
+	// machine
+	ck_assert(!rs_send_scp(conn,
+	                       (1 << 8) | 1, // Respond after 1 msec and one attempt
+	                       0, // Send no duplicates
+	                       0, // An arbitrary cmd_rc
+	                       0, 0, 0, 0, 0,
+	                       data,
+	                       data.len,
+	                       send_scp_cb, &cb_data));
+	
+	// Wait for a reply
+	ck_assert(!wait_for_all_cb());
+	ck_assert_uint_eq(cb_data.generic_info.n_calls, 1);
+	ck_assert(!cb_data.error);
+}
+END_TEST
+
+
 /**
  * Make sure that a single SCP command can be sent and received with varying
  * numbers of arguments.
@@ -782,6 +1013,292 @@ START_TEST (test_multiple_scp)
 END_TEST
 
 
+/**
+ * Make sure that a batch of packets sent with rs_send_scp_batch are all sent in
+ * parallel and that each gets its own callback.
+ */
+START_TEST (test_scp_batch)
+{
+	// Number parallel rounds worth of packets to send
+	const unsigned int n_rounds = 3;
+	
+	// Number of packets to send at once
+	const unsigned int n_packets = N_OUTSTANDING * n_rounds;
+	
+	unsigned int i;
+	
+	// Create an empty payload
+	uv_buf_t data;
+	data.base = NULL;
+	data.len = 0;
+	
+	// Create a set of callbacks which we'll wait on for replies
+	send_scp_cb_data_t cb_data[n_packets];
+	for (i = 0; i < n_packets; i++)
+		wait_for_cb((cb_data_t *)&(cb_data[i]));
+	
+	// Describe the batch of packets
+	rs_send_scp_req_t reqs[n_packets];
+	for (i = 0; i < n_packets; i++) {
+		reqs[i].dest_addr = (TIMEOUT/2 << 8) | 1; // Respond after half the
+		                                          // timeout.
+		reqs[i].dest_cpu = 0; // Send no duplicates
+		reqs[i].cmd_rc = 0; // An arbitrary cmd_rc
+		reqs[i].n_args_send = 1;
+		reqs[i].n_args_recv = 1;
+		reqs[i].arg1 = i; // The packet num as an argument
+		reqs[i].arg2 = 0;
+		reqs[i].arg3 = 0;
+		reqs[i].data = data;
+		reqs[i].data_max_len = data.len;
+		reqs[i].cb = send_scp_cb;
+		reqs[i].cb_data = &(cb_data[i]);
+	}
+	
+	// Send the whole batch at once
+	ck_assert(!rs_send_scp_batch(conn, reqs, n_packets));
+	
+	// Wait for a reply
+	uv_update_time(loop);
+	uint64_t time_before = uv_now(loop);
+	ck_assert(!wait_for_all_cb());
+	uint64_t time_after = uv_now(loop);
+	
+	// Check that the time required was such that it would only be possible of
+	// multiple commands were sent in parallel.
+	ck_assert_int_lt(time_after - time_before, (TIMEOUT/2) * n_rounds + FUDGE);
+	
+	for (i = 0; i < n_packets; i++) {
+		// Check that the responses came back once
+		ck_assert_uint_eq(cb_data[i].generic_info.n_calls, 1);
+		
+		// Check that the packet didn't fail and has the right argument
+		ck_assert(cb_data[i].conn == conn);
+		ck_assert(!cb_data[i].error);
+		ck_assert_uint_eq(cb_data[i].cmd_rc, 0);
+		ck_assert_uint_eq(cb_data[i].n_args, 1);
+		ck_assert_uint_eq(cb_data[i].arg1, i);
+		
+		// Check that one request the relevent sequence number was sent to the mock
+		// machine, i.e. the packets were sent in the order given.
+		mm_req_t *req = mm_get_req(mm, i);
+		ck_assert(req);
+		ck_assert_uint_eq(req->n_changes, 1);
+		ck_assert_uint_eq(req->n_tries, 1);
+		ck_assert_uint_eq(req->buf.len, RS__SIZEOF_SCP_PACKET(1, 0));
+		ck_assert_uint_eq(((sdp_scp_header_t *)req->buf.base)->arg1, i);
+	}
+}
+END_TEST
+
+
+/**
+ * Make sure that a flush completes only once all earlier requests have
+ * completed and that requests made after the flush wait for it.
+ */
+START_TEST (test_flush)
+{
+	// Number of packets to send before and after the flush
+	const unsigned int n_packets = N_OUTSTANDING * 2;
+	
+	unsigned int i;
+	
+	// Create an empty payload
+	uv_buf_t data;
+	data.base = NULL;
+	data.len = 0;
+	
+	// Flushing an idle connection should complete immediately
+	flush_cb_data_t idle_flush_cb_data;
+	idle_flush_cb_data.generic_info.n_calls = 0;
+	idle_flush_cb_data.preceding = NULL;
+	idle_flush_cb_data.n_preceding = 0;
+	ck_assert(!rs_flush(conn, flush_cb, &idle_flush_cb_data));
+	ck_assert_uint_eq(idle_flush_cb_data.generic_info.n_calls, 1);
+	ck_assert(idle_flush_cb_data.conn == conn);
+	ck_assert(!idle_flush_cb_data.error);
+	
+	// Create a set of callbacks which we'll wait on for replies
+	send_scp_cb_data_t before_cb_data[n_packets];
+	send_scp_cb_data_t after_cb_data[n_packets];
+	flush_cb_data_t flush_cb_data;
+	for (i = 0; i < n_packets; i++) {
+		wait_for_cb((cb_data_t *)&(before_cb_data[i]));
+		wait_for_cb((cb_data_t *)&(after_cb_data[i]));
+	}
+	wait_for_cb((cb_data_t *)&flush_cb_data);
+	flush_cb_data.preceding = before_cb_data;
+	flush_cb_data.n_preceding = n_packets;
+	
+	// Send some packets, flush and then send some more
+	for (i = 0; i < n_packets; i++)
+		ck_assert(!rs_send_scp(conn,
+		                       (1 << 8) | 1, // Respond quickly
+		                       0, // Send no duplicates
+		                       0, // An arbitrary cmd_rc
+		                       1, 1, i, 0, 0, // The packet num as an argument
+		                       data,
+		                       data.len,
+		                       send_scp_cb, &(before_cb_data[i])));
+	ck_assert(!rs_flush(conn, flush_cb, &flush_cb_data));
+	for (i = 0; i < n_packets; i++)
+		ck_assert(!rs_send_scp(conn,
+		                       (1 << 8) | 1, // Respond quickly
+		                       0, // Send no duplicates
+		                       0, // An arbitrary cmd_rc
+		                       1, 1, n_packets + i, 0, 0,
+		                       data,
+		                       data.len,
+		                       send_scp_cb, &(after_cb_data[i])));
+	
+	// The flush must not have completed yet
+	ck_assert_uint_eq(flush_cb_data.generic_info.n_calls, 0);
+	
+	// Wait for everything to complete
+	ck_assert(!wait_for_all_cb());
+	
+	// The flush should have completed once, after all the earlier packets
+	ck_assert_uint_eq(flush_cb_data.generic_info.n_calls, 1);
+	ck_assert(flush_cb_data.conn == conn);
+	ck_assert(!flush_cb_data.error);
+	ck_assert_uint_eq(flush_cb_data.n_preceding_incomplete, 0);
+	
+	for (i = 0; i < n_packets; i++) {
+		ck_assert_uint_eq(before_cb_data[i].generic_info.n_calls, 1);
+		ck_assert(!before_cb_data[i].error);
+		ck_assert_uint_eq(before_cb_data[i].arg1, i);
+		
+		ck_assert_uint_eq(after_cb_data[i].generic_info.n_calls, 1);
+		ck_assert(!after_cb_data[i].error);
+		ck_assert_uint_eq(after_cb_data[i].arg1, n_packets + i);
+	}
+	
+	// Every packet should have been sent exactly once, in the order requested
+	for (i = 0; i < n_packets * 2; i++) {
+		mm_req_t *req = mm_get_req(mm, i);
+		ck_assert_uint_eq(req->n_tries, 1);
+		ck_assert_uint_eq(((sdp_scp_header_t *)req->buf.base)->arg1, i);
+	}
+}
+END_TEST
+
+
+/**
+ * Make sure that requests are refused once the request queue is full and
+ * accepted again once it drains.
+ */
+START_TEST (test_max_queue_length)
+{
+	// Enough packets to fill every outstanding slot with more left queued
+	const unsigned int max_length = 2;
+	const unsigned int n_packets = N_OUTSTANDING + max_length;
+	
+	unsigned int i;
+	
+	// Create an empty payload
+	uv_buf_t data;
+	data.base = NULL;
+	data.len = 0;
+	
+	rs_set_max_queue_length(conn, max_length);
+	
+	// Create a set of callbacks which we'll wait on for replies
+	send_scp_cb_data_t cb_data[n_packets + 1];
+	for (i = 0; i < n_packets + 1; i++)
+		wait_for_cb((cb_data_t *)&(cb_data[i]));
+	
+	// Packets are removed from the queue as soon as they are sent so only those
+	// beyond the number of outstanding slots remain queued.
+	for (i = 0; i < n_packets; i++)
+		ck_assert(!rs_send_scp(conn,
+		                       (1 << 8) | 1, // Respond quickly
+		                       0, // Send no duplicates
+		                       0, // An arbitrary cmd_rc
+		                       0, 0, 0, 0, 0,
+		                       data,
+		                       data.len,
+		                       send_scp_cb, &(cb_data[i])));
+	
+	// The queue is now full
+	ck_assert(rs_send_scp(conn, (1 << 8) | 1, 0, 0, 0, 0, 0, 0, 0,
+	                      data, data.len,
+	                      send_scp_cb, &(cb_data[n_packets])));
+	ck_assert(rs_flush(conn, NULL, NULL));
+	
+	// Once a response frees up an outstanding slot, a queued packet is sent and
+	// more requests are accepted again.
+	while (cb_data[0].generic_info.n_calls == 0)
+		uv_run(loop, UV_RUN_ONCE);
+	ck_assert(!rs_send_scp(conn, (1 << 8) | 1, 0, 0, 0, 0, 0, 0, 0,
+	                       data, data.len,
+	                       send_scp_cb, &(cb_data[n_packets])));
+	
+	// Wait for everything to complete successfully
+	ck_assert(!wait_for_all_cb());
+	for (i = 0; i < n_packets + 1; i++) {
+		ck_assert_uint_eq(cb_data[i].generic_info.n_calls, 1);
+		ck_assert(!cb_data[i].error);
+	}
+}
+END_TEST
+
+
+/**
+ * Make sure that a batch which does not fit in the request queue is rejected
+ * without any of its packets being queued.
+ */
+START_TEST (test_scp_batch_all_or_nothing)
+{
+	const unsigned int max_length = N_OUTSTANDING;
+	
+	unsigned int i;
+	
+	// Create an empty payload
+	uv_buf_t data;
+	data.base = NULL;
+	data.len = 0;
+	
+	rs_set_max_queue_length(conn, max_length);
+	
+	// Only the packets of the batch which fits should produce callbacks
+	send_scp_cb_data_t cb_data[max_length + 1];
+	for (i = 0; i < max_length; i++)
+		wait_for_cb((cb_data_t *)&(cb_data[i]));
+	cb_data[max_length].generic_info.n_calls = 0;
+	
+	rs_send_scp_req_t reqs[max_length + 1];
+	for (i = 0; i < max_length + 1; i++) {
+		reqs[i].dest_addr = (1 << 8) | 1; // Respond quickly
+		reqs[i].dest_cpu = 0; // Send no duplicates
+		reqs[i].cmd_rc = 0; // An arbitrary cmd_rc
+		reqs[i].n_args_send = 1;
+		reqs[i].n_args_recv = 1;
+		reqs[i].arg1 = i;
+		reqs[i].arg2 = 0;
+		reqs[i].arg3 = 0;
+		reqs[i].data = data;
+		reqs[i].data_max_len = data.len;
+		reqs[i].cb = send_scp_cb;
+		reqs[i].cb_data = &(cb_data[i]);
+	}
+	
+	// The whole batch doesn't fit in the queue so none of it should be sent
+	ck_assert(rs_send_scp_batch(conn, reqs, max_length + 1));
+	
+	// A batch which does fit should be sent as usual
+	ck_assert(!rs_send_scp_batch(conn, reqs, max_length));
+	ck_assert(!wait_for_all_cb());
+	
+	for (i = 0; i < max_length; i++) {
+		ck_assert_uint_eq(cb_data[i].generic_info.n_calls, 1);
+		ck_assert(!cb_data[i].error);
+		ck_assert_uint_eq(cb_data[i].arg1, i);
+	}
+	ck_assert_uint_eq(cb_data[max_length].generic_info.n_calls, 0);
+}
+END_TEST
+
+
 /**
  * Make sure that a multi-packet read command can be sent and received. Also
  * checks that duplicate response packets are ignored.
@@ -1178,6 +1695,341 @@ END_TEST
 
 
 
+/**
+ * Callback for a write which overwrites the written buffer (as users are
+ * entitled to do once the callback has been called) after checking that no
+ * packet of the write is still being sent from it.
+ */
+void
+rw_overwrite_cb(rs_conn_t *conn,
+                int error,
+                uint16_t cmd_rc,
+                uv_buf_t data,
+                void *cb_data)
+{
+	int i;
+	for (i = 0; i < conn->n_outstanding; i++)
+		ck_assert(!(conn->outstanding[i].type == RS__REQ_WRITE &&
+		            conn->outstanding[i].send_req_active));
+	
+	memset(data.base, 0xFF, data.len);
+	
+	rw_cb(conn, error, cmd_rc, data, cb_data);
+}
+
+
+/**
+ * Make sure that when a write fails part way through, the callback isn't
+ * called until the connection has finished sending from the user's buffer and
+ * that overwriting the buffer in the callback doesn't change what is written.
+ */
+START_TEST (test_write_fail_buffer_reuse)
+{
+	// Offset for the data in memory
+	const size_t offset = 10;
+	
+	// Number parallel rounds worth of packets to send
+	const unsigned int n_rounds = 5;
+	
+	// Number of packets to send
+	const size_t n_packets = n_rounds * N_OUTSTANDING;
+	
+	// Length of the write request selected to require the specified number of
+	// rounds
+	const size_t length = MM_SCP_DATA_LENGTH * n_packets;
+	
+	size_t i;
+	
+	// Get a reference to the memory block we're going to write to
+	mm_rw_t *rw = mm_get_rw(mm, 0);
+	
+	// Create a callback which we'll wait on for a reply
+	rw_cb_data_t cb_data;
+	wait_for_cb((cb_data_t *)&cb_data);
+	
+	// Set a buffer with some dummy data to write (and a copy to check against)
+	unsigned char data_buf[length];
+	unsigned char orig_data_buf[length];
+	for (i = 0; i < length; i++)
+		orig_data_buf[i] = data_buf[i] = (unsigned char)i;
+	uv_buf_t data;
+	data.base = (void *)data_buf;
+	data.len = length;
+	
+	uint32_t addr = (offset |  // Start at the given offset
+	                 0u<<10 |  // The RW ID
+	                 1u<<16 |  // Return an error on the 2nd reply
+	                 255u<<24); // Respond to all the same speed
+	
+	// Write the data
+	ck_assert(!rs_write(conn,
+	                    (0 << 8) | 1, // Always reply instantly
+	                    0, // Send no duplicates
+	                    addr,
+	                    data,
+	                    rw_overwrite_cb, &cb_data));
+	ck_assert(!wait_for_all_cb());
+	
+	// Check the write failed
+	ck_assert_uint_eq(cb_data.generic_info.n_calls, 1);
+	ck_assert(cb_data.error == RS_EBAD_RC);
+	
+	// Make sure everything sent by the write has reached the machine by waiting
+	// for a later packet to make the round trip
+	send_scp_cb_data_t scp_cb_data;
+	wait_for_cb((cb_data_t *)&scp_cb_data);
+	uv_buf_t empty;
+	empty.base = NULL;
+	empty.len = 0;
+	ck_assert(!rs_send_scp(conn, (0 << 8) | 1, 0, 0, 0, 0, 0, 0, 0,
+	                       empty, empty.len,
+	                       send_scp_cb, &scp_cb_data));
+	ck_assert(!wait_for_all_cb());
+	
+	// Only the original data should have been written
+	for (i = 0; i < length; i++)
+		if (rw->write_count[offset + i])
+			ck_assert_uint_eq((unsigned char)rw->data[offset + i],
+			                  orig_data_buf[i]);
+}
+END_TEST
+
+
+/**
+ * Data for rw_send_scp_cb: the rw_cb data followed by the data for the callback
+ * of the SCP packet to send.
+ */
+typedef struct {
+	rw_cb_data_t rw_cb_data;
+	send_scp_cb_data_t *send_scp_cb_data;
+} rw_send_scp_cb_data_t;
+
+
+/**
+ * Callback for a read/write which sends an SCP packet from within the
+ * callback.
+ */
+void
+rw_send_scp_cb(rs_conn_t *conn,
+               int error,
+               uint16_t cmd_rc,
+               uv_buf_t data,
+               void *cb_data)
+{
+	rw_send_scp_cb_data_t *d = (rw_send_scp_cb_data_t *)cb_data;
+	
+	uv_buf_t empty;
+	empty.base = NULL;
+	empty.len = 0;
+	ck_assert(!rs_send_scp(conn, (0 << 8) | 1, 0, 0, 0, 0, 0, 0, 0,
+	                       empty, empty.len,
+	                       send_scp_cb, d->send_scp_cb_data));
+	
+	rw_cb(conn, error, cmd_rc, data, cb_data);
+}
+
+
+/**
+ * Make sure that making a request from the error callback of a failed write
+ * doesn't cause any more of the cancelled write to be sent. The write fails
+ * with a bad response (_i == 0) or times out (_i == 1).
+ */
+START_TEST (test_write_fail_request_in_cb)
+{
+	bool timeout = _i == 1;
+	
+	// Offset for the data in memory
+	const size_t offset = 10;
+	
+	// Number parallel rounds worth of packets to send
+	const unsigned int n_rounds = 5;
+	
+	// Number of packets to send
+	const size_t n_packets = n_rounds * N_OUTSTANDING;
+	
+	// Length of the write request selected to require the specified number of
+	// rounds
+	const size_t length = MM_SCP_DATA_LENGTH * n_packets;
+	
+	size_t i;
+	
+	// Create the callbacks which we'll wait on
+	send_scp_cb_data_t scp_cb_data;
+	rw_send_scp_cb_data_t cb_data;
+	cb_data.send_scp_cb_data = &scp_cb_data;
+	wait_for_cb((cb_data_t *)&cb_data);
+	wait_for_cb((cb_data_t *)&scp_cb_data);
+	
+	// Set a buffer with some dummy data to write
+	unsigned char data_buf[length];
+	for (i = 0; i < length; i++)
+		data_buf[i] = (unsigned char)i;
+	uv_buf_t data;
+	data.base = (void *)data_buf;
+	data.len = length;
+	
+	uint32_t addr = (offset |  // Start at the given offset
+	                 0u<<10 |  // The RW ID
+	                 (timeout ? 255u  // No errors or...
+	                          : 0u)<<16 |  // ...an error on the 1st reply
+	                 (timeout ? 0u  // Never respond or...
+	                          : 255u)<<24); // ...respond to all the same speed
+	
+	// Write the data. The replies are delayed slightly so that every packet has
+	// been sent by the time the error arrives and so the callback is called
+	// immediately.
+	ck_assert(!rs_write(conn,
+	                    (1 << 8) | (timeout ? 0 : 1), // Reply after 1 msec
+	                    0, // Send no duplicates
+	                    addr,
+	                    data,
+	                    rw_send_scp_cb, &cb_data));
+	ck_assert(!wait_for_all_cb());
+	
+	// Check the write failed and the packet sent from its callback succeeded
+	ck_assert_uint_eq(cb_data.rw_cb_data.generic_info.n_calls, 1);
+	ck_assert(cb_data.rw_cb_data.error == (timeout ? RS_ETIMEOUT : RS_EBAD_RC));
+	ck_assert_uint_eq(scp_cb_data.generic_info.n_calls, 1);
+	ck_assert(!scp_cb_data.error);
+	
+	// Only the write packets sent before the error arrived (one per outstanding
+	// slot) should have reached the machine.
+	unsigned int n_writes = 0;
+	mm_req_t *req;
+	for (req = mm->reqs; req; req = req->next)
+		if (((sdp_scp_header_t *)req->buf.base)->cmd_rc == RS__SCP_CMD_WRITE)
+			n_writes++;
+	ck_assert_uint_eq(n_writes, N_OUTSTANDING);
+}
+END_TEST
+
+
+/**
+ * Make sure that freeing a connection calls the callback of a write whose
+ * packets are still being sent immediately.
+ */
+START_TEST (test_free_write_cb)
+{
+	// Number of packets to send
+	const size_t n_packets = 3 * N_OUTSTANDING;
+	
+	// Length of the write request selected to require the specified number of
+	// packets
+	const size_t length = MM_SCP_DATA_LENGTH * n_packets;
+	
+	int i;
+	
+	rw_cb_data_t cb_data;
+	cb_data.generic_info.n_calls = 0;
+	
+	// Set a buffer with some dummy data to write
+	unsigned char data_buf[length];
+	memset(data_buf, 0, length);
+	uv_buf_t data;
+	data.base = (void *)data_buf;
+	data.len = length;
+	
+	// Start a write (some of whose packets will still be being sent)
+	ck_assert(!rs_write(conn,
+	                    (0 << 8) | 0, // Never reply
+	                    0, // Send no duplicates
+	                    0u<<10 | 255u<<16 | 255u<<24,
+	                    data,
+	                    rw_cb, &cb_data));
+	
+	// The callback should be called before rs_free returns
+	rs_free(conn, NULL, NULL);
+	ck_assert_uint_eq(cb_data.generic_info.n_calls, 1);
+	ck_assert(cb_data.error == RS_EFREE);
+	conn = NULL;
+	
+	// ...and never again
+	for (i = 0; i < 10; i++)
+		uv_run(loop, UV_RUN_NOWAIT);
+	ck_assert_uint_eq(cb_data.generic_info.n_calls, 1);
+}
+END_TEST
+
+
+/**
+ * Feed a response with the given sequence number and response code to the
+ * connection as if it had just been received.
+ */
+static void
+receive_response(rs_conn_t *conn, uint16_t seq_num, uint16_t cmd_rc)
+{
+	char dgram[2 + RS__SIZEOF_SCP_PACKET(0, 0)];
+	uv_buf_t empty;
+	empty.base = NULL;
+	empty.len = 0;
+	uv_buf_t packet;
+	packet.base = dgram + 2;
+	rs__pack_scp_packet(&packet, 0, 0, 0, cmd_rc, seq_num, 0, 0, 0, 0, empty);
+	
+	uv_buf_t buf;
+	buf.base = dgram;
+	buf.len = sizeof(dgram);
+	rs__udp_recv_cb(&(conn->udp_handle), buf.len, &buf, NULL, 0);
+}
+
+
+/**
+ * Make sure that a write which fails while another of its packets is being
+ * retransmitted isn't reported as a success when a late (OK) response to that
+ * packet arrives before the retransmission's send request completes.
+ */
+START_TEST (test_write_fail_late_response)
+{
+	// Length of the write request selected to require two packets, one per
+	// outstanding slot
+	const size_t length = MM_SCP_DATA_LENGTH * 2;
+	
+	int i;
+	
+	rw_cb_data_t cb_data;
+	wait_for_cb((cb_data_t *)&cb_data);
+	
+	unsigned char data_buf[length];
+	memset(data_buf, 0, length);
+	uv_buf_t data;
+	data.base = (void *)data_buf;
+	data.len = length;
+	
+	// Start a write which the machine never replies to and wait for both of its
+	// packets to be sent
+	ck_assert(!rs_write(conn,
+	                    (0 << 8) | 0, // Never reply
+	                    0, // Send no duplicates
+	                    0u<<10 | 255u<<16 | 255u<<24,
+	                    data,
+	                    rw_cb, &cb_data));
+	rs__outstanding_t *os_a = conn->outstanding + 0;
+	rs__outstanding_t *os_b = conn->outstanding + 1;
+	ck_assert(os_a->active && os_a->type == RS__REQ_WRITE);
+	ck_assert(os_b->active && os_b->type == RS__REQ_WRITE);
+	while (os_a->send_req_active || os_b->send_req_active)
+		uv_run(loop, UV_RUN_ONCE);
+	
+	// Retransmit the second packet and, while this is still being sent, fail
+	// the first packet and then deliver a late OK response to the second.
+	rs__attempt_transmission(conn, os_b);
+	ck_assert(os_b->send_req_active);
+	receive_response(conn, os_a->seq_num, RS__SCP_CMD_OK + 1);
+	receive_response(conn, os_b->seq_num, RS__SCP_CMD_OK);
+	
+	// The write should fail exactly once
+	ck_assert(!wait_for_all_cb());
+	ck_assert_uint_eq(cb_data.generic_info.n_calls, 1);
+	ck_assert(cb_data.error == RS_EBAD_RC);
+	ck_assert_uint_eq(cb_data.cmd_rc, RS__SCP_CMD_OK + 1);
+	
+	for (i = 0; i < 10; i++)
+		uv_run(loop, UV_RUN_NOWAIT);
+	ck_assert_uint_eq(cb_data.generic_info.n_calls, 1);
+}
+END_TEST
+
+
 Suite *
 make_rig_scp_suite(void)
 {
@@ -1187,17 +2039,29 @@ make_rig_scp_suite(void)
 	TCase *tc_core = tcase_create("Core");
 	tcase_add_checked_fixture(tc_core, setup, teardown);
 	tcase_add_test(tc_core, test_empty);
+	tcase_add_test(tc_core, test_addr_copied);
+	tcase_add_test(tc_core, test_update_params);
+	tcase_add_test(tc_core, test_err_name_r);
+	tcase_add_test(tc_core, test_set_socket_buffer_sizes);
 	tcase_add_loop_test(tc_core, test_single_scp, 0, 4);
 	tcase_add_test(tc_core, test_single_scp_timeout);
 	tcase_add_test(tc_core, test_single_scp_retransmit);
 	tcase_add_loop_test(tc_core, test_single_packet_read, 0, 4);
 	tcase_add_loop_test(tc_core, test_single_packet_write, 0, 4);
 	tcase_add_test(tc_core, test_multiple_scp);
+	tcase_add_test(tc_core, test_scp_batch);
+	tcase_add_test(tc_core, test_flush);
+	tcase_add_test(tc_core, test_max_queue_length);
+	tcase_add_test(tc_core, test_scp_batch_all_or_nothing);
 	tcase_add_test(tc_core, test_multiple_packet_read);
 	tcase_add_test(tc_core, test_multiple_packet_write);
 	tcase_add_test(tc_core, test_non_obstructing);
 	tcase_add_test(tc_core, test_read_timeout);
 	tcase_add_test(tc_core, test_read_fail);
+	tcase_add_test(tc_core, test_write_fail_buffer_reuse);
+	tcase_add_loop_test(tc_core, test_write_fail_request_in_cb, 0, 2);
+	tcase_add_test(tc_core, test_free_write_cb);
+	tcase_add_test(tc_core, test_write_fail_late_response);
 	
 	
 	// Add each test case to the suite